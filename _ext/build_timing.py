@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+import time
+
+# Sphinx only puts _ext/ itself on the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from pythonbook import TIMINGS_ENV # the file to write timings to, if set
+
+
+def timed(stage, method, timings):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timings[stage] = timings.get(stage, 0) + time.perf_counter() - start
+    return wrapper
+
+
+def builder_inited(app):
+    timings = app.build_timings
+    builder = app.builder
+    builder.read = timed('sphinx/read', builder.read, timings)
+    builder.write = timed('sphinx/write', builder.write, timings)
+    builder.finish = timed('sphinx/assets', builder.finish, timings)
+
+
+def build_finished(app, exception):
+    if exception is None:
+        with open(os.environ[TIMINGS_ENV], 'w') as f:
+            json.dump(app.build_timings, f, indent=1)
+
+
+def setup(app):
+    if os.environ.get(TIMINGS_ENV):
+        app.build_timings = {}
+        app.connect('builder-inited', builder_inited)
+        app.connect('build-finished', build_finished)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
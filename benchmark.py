@@ -0,0 +1,81 @@
+# ! python
+# coding: utf-8
+
+import os
+import sys
+import argparse
+import glob
+
+from pythonbook.notebooks import ROOT
+from pythonbook.benchmark import (DEFAULT_HISTORY_PATH, time_notebook,
+                                  time_sphinx_build, load_history,
+                                  append_history, baseline, compare,
+                                  format_comparison)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Times each stage of the \
+                                                  book build and checks for \
+                                                  regressions.")
+    parser.add_argument('chapters', metavar='F', type=str, nargs='*',
+        help="Chapter notebook(s) to time (default Chapters/*.ipynb).")
+    parser.add_argument('-t', '--timeout', help='Length of time (in secs) a cell \
+        can run before raising TimeoutError (default 600).', default=600,
+        type=int, required=False)
+    parser.add_argument('--skip-execute', help='Do not time notebook \
+        execution.', action='store_true')
+    parser.add_argument('--skip-build', help='Do not time the jupyter-book \
+        build.', action='store_true')
+    parser.add_argument('--history', help='History file that every run is \
+        appended to (default %s).' % DEFAULT_HISTORY_PATH,
+        default=DEFAULT_HISTORY_PATH, required=False)
+    parser.add_argument('--window', help='Number of earlier runs whose median \
+        is the baseline (default 5).', default=5, type=int, required=False)
+    parser.add_argument('--baseline-commit', help='Only use earlier runs of \
+        this commit as the baseline.', default=None, required=False)
+    parser.add_argument('--tolerance', help='Fraction by which a stage may be \
+        slower than the baseline before it counts as a regression (default \
+        0.2).', default=0.2, type=float, required=False)
+    parser.add_argument('--min-delta', help='Smallest slowdown (in secs) that \
+        counts as a regression, whatever the fraction (default 1.0).',
+        default=1.0, type=float, required=False)
+    parser.add_argument('--gate', help='Fail only for regressions in stages \
+        starting with this prefix (default "execute/"; "" for all stages).',
+        default='execute/', required=False)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    chapters = args.chapters or sorted(
+        glob.glob(os.path.join(ROOT, 'Chapters', '*.ipynb')))
+    history = load_history(args.history)
+    reference = baseline(history, args.window, args.baseline_commit)
+
+    stages = {}
+    if not args.skip_execute:
+        for path in chapters:
+            name = os.path.basename(path)[:-6]
+            print('Executing', name)
+            stages['execute/' + name] = time_notebook(path, args.timeout)
+    if not args.skip_build:
+        print('Building book')
+        stages.update(time_sphinx_build(
+            os.path.join(ROOT, 'Chapters'),
+            os.path.join(ROOT, 'yaml', '_config.yml'),
+            os.path.join(ROOT, 'yaml', '_toc.yml')))
+
+    append_history(stages, args.history)
+    rows = compare(stages, reference, args.tolerance, args.min_delta)
+    print('*****')
+    print(format_comparison(rows))
+    regressions = [row[0] for row in rows
+                   if row[4] and row[0].startswith(args.gate)]
+    if regressions:
+        print('*****')
+        print('Regressed beyond tolerance:', ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,10 @@
 #!/bin/bash
 
+# re-execute only the chapters whose code, data or environment changed
+cd /Users/ethan/Documents/GitHub/pythonbook/Chapters
+python ../run_notebooks.py --incremental --jobs 4 *.ipynb || exit 1
+cd /Users/ethan/Documents/GitHub/pythonbook
+
 # build html documents
 jupyter-book build /Users/ethan/Documents/GitHub/pythonbook/Chapters/ --path-output /Users/ethan/Documents/GitHub/pythonbook/Book --config /Users/ethan/Documents/GitHub/pythonbook/yaml/_config.yml --toc /Users/ethan/Documents/GitHub/pythonbook/yaml/_toc.yml
 
@@ -0,0 +1,8 @@
+"""Helpers for building and running the Learning Statistics with Python book."""
+
+# Set this environment variable to a file path to have the Sphinx extension
+# in _ext/build_timing.py record how long Sphinx spends reading sources,
+# writing pages and copying assets. Defined here, rather than in
+# pythonbook.benchmark, so the extension can import it without pulling in
+# nbconvert and the rest of the build.
+TIMINGS_ENV = 'PYTHONBOOK_BUILD_TIMINGS'
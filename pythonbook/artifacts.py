@@ -0,0 +1,84 @@
+"""A store of simulated arrays, computed once and memory mapped after that.
+
+Build-side simulations (see `pythonbook.sampling`) draw the same large
+random arrays on every build. `ArtifactStore.cached` computes an array from
+a seed the first time it is asked for, saves it as a `.npy` file named by a
+hash of what was simulated, its parameters and the seed, and from then on
+maps that file into memory with `np.load(..., mmap_mode='r')` instead of
+simulating again. The same call therefore returns the same numbers in every
+process and every build. `simulate` does this for a single draw from a
+`numpy.random.Generator`:
+
+    simulate('binomial', n=100, p=.5, size=10000, seed=1)
+
+The arrays are mapped read-only; copy one before modifying it. The chapters
+themselves don't use the store: readers run them without pythonbook, so
+they draw from `np.random.default_rng` directly.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from pythonbook.notebooks import ROOT
+
+DEFAULT_ARTIFACT_DIR = os.path.join(ROOT, '.nbcache', 'artifacts')
+
+
+class ArtifactStore:
+
+    def __init__(self, path=DEFAULT_ARTIFACT_DIR):
+        self.path = path
+
+    def key(self, name, params, seed):
+        payload = {
+            'name': name,
+            'params': params,
+            'seed': seed,
+            # Generator's algorithms may change between numpy releases
+            'numpy': '.'.join(np.__version__.split('.')[:2]),
+        }
+        encoded = json.dumps(payload, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def cached(self, name, params, seed, compute):
+        """Return `compute(seed)`, from the store if it is there.
+
+        `name` and `params`, a dict of JSON values, say what `compute`
+        simulates; together with `seed` they name the stored array.
+        """
+        path = os.path.join(self.path,
+                            self.key(name, params, seed) + '.npy')
+        if not os.path.exists(path):
+            values = np.asarray(compute(seed))
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, values)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        return np.load(path, mmap_mode='r')
+
+    def get(self, distribution, size, seed, **params):
+        """Return `default_rng(seed).<distribution>(size=size, **params)`."""
+        size = tuple(np.atleast_1d(size).tolist())
+
+        def draw(seed):
+            rng = np.random.default_rng(seed)
+            return getattr(rng, distribution)(size=size, **params)
+
+        return self.cached(distribution, dict(params, size=size), seed, draw)
+
+
+def simulate(distribution, size, seed=0, **params):
+    """Draw, or reuse, an array from the default artifact store, e.g.
+
+        simulate('binomial', n=100, p=.5, size=10000, seed=1)
+    """
+    return ArtifactStore().get(distribution, size, seed, **params)
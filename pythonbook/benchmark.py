@@ -0,0 +1,141 @@
+"""Stage-by-stage build timings, with a history file and regression checks.
+
+A benchmark run produces a flat mapping of stage name to seconds, e.g.
+`execute/05.04-regression`, `sphinx/read`, `sphinx/write` and
+`sphinx/assets`. Each run is appended as one JSON line to a history file
+and compared against a baseline made from earlier runs in that file.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import nbformat
+from nbconvert.preprocessors import ExecutePreprocessor
+
+from pythonbook import TIMINGS_ENV
+from pythonbook.datasets import kernel_arguments
+from pythonbook.notebooks import ROOT
+
+DEFAULT_HISTORY_PATH = os.path.join(ROOT, '.benchmarks', 'history.jsonl')
+
+
+def time_notebook(path, timeout=600):
+    """Execute the notebook at `path` in a fresh kernel and return seconds.
+
+    The executed notebook is discarded. Raises the execution error, if any,
+    since a failed chapter has no meaningful time.
+    """
+    nb = nbformat.read(path, as_version=4)
+    ep = ExecutePreprocessor(timeout=timeout, kernel_name='python3',
+                             extra_arguments=kernel_arguments())
+    start = time.perf_counter()
+    ep.preprocess(nb, {'metadata': {'path': os.path.dirname(path)}})
+    return time.perf_counter() - start
+
+
+def time_sphinx_build(source_dir, config, toc, jupyter_book='jupyter-book'):
+    """Run `jupyter-book build` into a temporary directory.
+
+    Returns the stage timings reported by the build_timing extension plus
+    `sphinx/total`, the wall time of the whole command.
+    """
+    with tempfile.TemporaryDirectory() as output_dir:
+        timings_path = os.path.join(output_dir, 'timings.json')
+        env = dict(os.environ, **{TIMINGS_ENV: timings_path})
+        start = time.perf_counter()
+        subprocess.run([jupyter_book, 'build', source_dir,
+                        '--path-output', output_dir,
+                        '--config', config, '--toc', toc],
+                       env=env, check=True)
+        total = time.perf_counter() - start
+        with open(timings_path) as f:
+            timings = json.load(f)
+    timings['sphinx/total'] = total
+    return timings
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path=DEFAULT_HISTORY_PATH):
+    runs = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    runs.append(json.loads(line))
+    return runs
+
+
+def append_history(stages, path=DEFAULT_HISTORY_PATH):
+    run = {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': current_commit(),
+        'stages': stages,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(run, sort_keys=True) + '\n')
+    return run
+
+
+def baseline(runs, window=5, commit=None):
+    """Median time of each stage over the last `window` runs.
+
+    With `commit`, only runs from commits starting with that prefix count.
+    """
+    if commit:
+        runs = [run for run in runs
+                if (run.get('commit') or '').startswith(commit)]
+    runs = runs[-window:]
+    stages = {}
+    for run in runs:
+        for stage, seconds in run['stages'].items():
+            stages.setdefault(stage, []).append(seconds)
+    return {stage: statistics.median(times) for stage, times in stages.items()}
+
+
+def compare(stages, reference, tolerance=0.2, min_delta=1.0):
+    """Compare a run with a baseline.
+
+    Returns rows of (stage, baseline, seconds, relative change, regressed).
+    A stage has regressed when it is more than `tolerance` (a fraction)
+    slower than the baseline *and* at least `min_delta` seconds slower, so
+    that noise in stages that take a fraction of a second never fails a
+    build.
+    """
+    rows = []
+    for stage in sorted(stages):
+        seconds = stages[stage]
+        before = reference.get(stage)
+        if before is None:
+            rows.append((stage, None, seconds, None, False))
+            continue
+        change = (seconds - before) / before if before else 0.0
+        regressed = change > tolerance and seconds - before >= min_delta
+        rows.append((stage, before, seconds, change, regressed))
+    return rows
+
+
+def format_comparison(rows):
+    lines = ['%-40s %10s %10s %8s' % ('stage', 'baseline', 'this run',
+                                      'change')]
+    for stage, before, seconds, change, regressed in rows:
+        before = '%10.2f' % before if before is not None else '%10s' % '-'
+        change = '%+7.0f%%' % (100 * change) if change is not None \
+            else '%8s' % 'new'
+        lines.append('%-40s %s %10.2f %s%s' % (stage, before, seconds, change,
+                                               '  REGRESSED' if regressed
+                                               else ''))
+    return '\n'.join(lines)
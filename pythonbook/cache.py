@@ -0,0 +1,108 @@
+"""On-disk cache of notebook outputs, keyed by what the notebook executes.
+
+The key is a hash of the normalized code cells, the kernel name and the
+contents of every data file the code refers to, so editing markdown cells
+(or the outputs themselves) never invalidates an entry, while editing code
+or one of the CSVs in Data/ always does.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import nbformat
+
+from pythonbook.notebooks import (ROOT, code_cells, normalize_source,
+                                  kernel_name, data_fingerprint)
+
+CACHE_VERSION = 1
+# Its own directory: .nbcache/ also holds the incremental state and the run
+# journal, which eviction must never touch
+DEFAULT_CACHE_DIR = os.path.join(ROOT, '.nbcache', 'outputs')
+DEFAULT_MAX_SIZE = 500 * 1024 * 1024 # bytes
+
+ENTRY_RE = re.compile(r'^[0-9a-f]{64}\.json$') # see _entry_path()
+
+
+def notebook_key(nb):
+    payload = {
+        'version': CACHE_VERSION,
+        'kernel': kernel_name(nb),
+        'cells': [normalize_source(cell.source) for cell in code_cells(nb)],
+        'data': data_fingerprint(nb),
+    }
+    encoded = json.dumps(payload, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ExecutionCache:
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, nb, key=None):
+        """Restore cached outputs into `nb` in place.
+
+        Returns True on a hit and False (leaving `nb` untouched) on a miss.
+        """
+        key = key or notebook_key(nb)
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False
+        cells = code_cells(nb)
+        if len(entry['cells']) != len(cells):
+            return False
+        for cell, cached in zip(cells, entry['cells']):
+            cell.execution_count = cached['execution_count']
+            cell.outputs = [nbformat.from_dict(output)
+                            for output in cached['outputs']]
+        # Mark the entry as recently used for eviction
+        os.utime(entry_path)
+        return True
+
+    def put(self, nb, key=None):
+        key = key or notebook_key(nb)
+        entry = {
+            'key': key,
+            'cells': [{'execution_count': cell.get('execution_count'),
+                       'outputs': cell.get('outputs', [])}
+                      for cell in code_cells(nb)],
+        }
+        os.makedirs(self.path, exist_ok=True)
+        # Write to a temporary file first so that notebooks running in
+        # parallel never see a half-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._entry_path(key))
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until under `max_size`.
+
+        Only cache entries count, so a cache directory shared with other
+        files never loses them.
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if ENTRY_RE.match(name):
+                stat = os.stat(os.path.join(self.path, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass # Already evicted by another worker
+            total -= size
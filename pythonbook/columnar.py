@@ -0,0 +1,134 @@
+"""Columnar copies of the CSV datasets, so each CSV is parsed only once.
+
+The first time a CSV is loaded it is parsed with `pandas.read_csv` as usual
+and the DataFrame, dtypes included, is written next to a small index entry
+as an uncompressed Feather file. Later loads memory map that file instead
+of parsing the CSV again; `read` still copies the columns into a new
+DataFrame, which the chapters are free to modify, so what is saved is the
+parsing, not the memory. `table` returns the mapped Arrow table itself,
+for callers (see `pythonbook.lazy`) that only touch part of it.
+
+The index records the CSV's sha256 (and its size and mtime, so an
+unchanged file is not re-hashed on every load); when the hash changes the
+Feather file is rebuilt. The same goes for the dataset's schema (see
+`pythonbook.schemas`), which is applied before the DataFrame is stored.
+
+Feather support comes from pyarrow, which is optional: without it, or for
+a DataFrame pyarrow can't store, `ColumnarCache.read` just parses the CSV.
+"""
+
+import json
+import os
+import tempfile
+
+from pythonbook.notebooks import ROOT, file_hash
+from pythonbook.schemas import apply_schema, schema_hash
+
+try:
+    import pyarrow
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+COLUMNAR_VERSION = 2
+DEFAULT_COLUMNAR_DIR = os.path.join(ROOT, '.nbcache', 'columnar')
+
+
+def _write_atomic(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ColumnarCache:
+
+    def __init__(self, path=DEFAULT_COLUMNAR_DIR):
+        self.path = path
+
+    def _paths(self, csv_path):
+        name = os.path.basename(csv_path)
+        base = os.path.join(self.path, name)
+        return base + '.feather', base + '.json'
+
+    def _source_hash(self, csv_path, index):
+        # Only re-hash the CSV when it looks different from last time
+        stat = os.stat(csv_path)
+        if index and index.get('size') == stat.st_size \
+                and index.get('mtime_ns') == stat.st_mtime_ns:
+            return index['sha256'], stat
+        return file_hash(csv_path), stat
+
+    def _cached_table(self, csv_path, schema):
+        # Return the up to date Feather copy, memory mapped, or None
+        feather_path, index_path = self._paths(csv_path)
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+        source_hash, stat = self._source_hash(csv_path, index)
+        if index and index.get('version') == COLUMNAR_VERSION \
+                and index.get('sha256') == source_hash \
+                and index.get('schema') == schema_hash(schema):
+            try:
+                return feather.read_table(feather_path, memory_map=True), \
+                    source_hash, stat
+            except (OSError, ValueError):
+                pass # Missing or damaged, to be rebuilt
+        return None, source_hash, stat
+
+    def read(self, csv_path, schema=None):
+        """Return `pandas.read_csv(csv_path)` with `schema` applied.
+
+        A DataFrame from the Feather copy owns its data: it is converted
+        from the mapped file, not a view of it.
+        """
+        import pandas as pd
+        if feather is None:
+            return apply_schema(pd.read_csv(csv_path), schema)
+        table, source_hash, stat = self._cached_table(csv_path, schema)
+        if table is not None:
+            return table.to_pandas()
+        df = apply_schema(pd.read_csv(csv_path), schema)
+        self.write(csv_path, df, source_hash, stat, schema)
+        return df
+
+    def table(self, csv_path, schema=None):
+        """Return the columnar copy of `csv_path` as a memory-mapped
+        `pyarrow.Table`, building it first if needed.
+
+        Returns None without pyarrow, or if the data can't be stored.
+        """
+        import pandas as pd
+        if feather is None:
+            return None
+        table, source_hash, stat = self._cached_table(csv_path, schema)
+        if table is None:
+            df = apply_schema(pd.read_csv(csv_path), schema)
+            self.write(csv_path, df, source_hash, stat, schema)
+            table, _, _ = self._cached_table(csv_path, schema)
+        return table
+
+    def write(self, csv_path, df, source_hash, stat, schema=None):
+        feather_path, index_path = self._paths(csv_path)
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            _write_atomic(feather_path, lambda path: feather.write_feather(
+                df, path, compression='uncompressed'))
+        except (ValueError, TypeError, pyarrow.ArrowException):
+            return # Not representable in Feather, keep parsing the CSV
+        index = {'version': COLUMNAR_VERSION, 'sha256': source_hash,
+                 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                 'schema': schema_hash(schema)}
+
+        def write_index(path):
+            with open(path, 'w') as f:
+                json.dump(index, f)
+
+        # The index goes last, so it never points at a half-written file
+        _write_atomic(index_path, write_index)
@@ -0,0 +1,171 @@
+"""Load the book's datasets from disk instead of over the network.
+
+The chapters read their data with
+`pd.read_csv('https://raw.githubusercontent.com/ethanweed/pythonbook/main/Data/...')`
+so that readers can run the code without a copy of the repository. When the
+book is built those files are already in `Data/`, so `dataset_path` resolves
+a dataset name to
+
+1. `Data/<name>`, if it exists, then
+2. a copy in the dataset cache whose sha256 still matches the one recorded
+   when it was downloaded, then
+3. a fresh download into the cache, unless offline mode is on, in which case
+   a `DatasetError` is raised instead.
+
+Downloads come from `BASE_URL`, or from the URL in $PYTHONBOOK_DATA_URL,
+e.g. a local stand-in server (`python -m http.server -d Data`).
+
+`load_dataset` serves plain CSV loads from the shared store of the current
+run (see `pythonbook.sharedstore`), if there is one, and otherwise from
+`pythonbook.columnar`, so each file is parsed once, and gives the columns
+the types in the dataset's schema (see `pythonbook.schemas`). `install()`
+patches `pandas.read_csv` so that the chapter URLs go through
+`load_dataset`; run_notebooks.py does this in every kernel it starts (see
+`kernel_arguments`), so the chapters themselves don't change.
+"""
+
+import functools
+import os
+import shutil
+import tempfile
+import urllib.parse
+import urllib.request
+
+from pythonbook.columnar import ColumnarCache
+from pythonbook.notebooks import ROOT, DATA_DIR, data_file_path, file_hash
+from pythonbook.schemas import apply_schema, load_schema
+from pythonbook.sharedstore import shared_frame
+
+BASE_URL = 'https://raw.githubusercontent.com/ethanweed/pythonbook/main/Data/'
+DEFAULT_CACHE_DIR = os.path.join(ROOT, '.nbcache', 'datasets')
+OFFLINE_ENV = 'PYTHONBOOK_OFFLINE'
+DATA_URL_ENV = 'PYTHONBOOK_DATA_URL'
+
+# Run at kernel startup. Binds no names in the user namespace, so a chapter
+# that forgets `import pandas` still fails.
+KERNEL_SETUP = ("__import__('sys').path.insert(0, %r); "
+                "__import__('pythonbook.datasets').datasets.install()" % ROOT)
+
+
+class DatasetError(OSError):
+    pass
+
+
+def is_offline(offline=None):
+    if offline is None:
+        offline = os.environ.get(OFFLINE_ENV, '') not in ('', '0')
+    return offline
+
+
+def dataset_name(url):
+    """Return the dataset name for one of the book's data URLs, or None."""
+    if isinstance(url, str) and url.startswith(BASE_URL):
+        return urllib.parse.unquote(url[len(BASE_URL):])
+    return None
+
+
+def data_url():
+    """Return the URL datasets are downloaded from, ending in '/'."""
+    url = os.environ.get(DATA_URL_ENV) or BASE_URL
+    return url if url.endswith('/') else url + '/'
+
+
+def cached_path(name, cache_dir=DEFAULT_CACHE_DIR):
+    """Return the cached copy of `name` if it is intact, else None."""
+    path = os.path.join(cache_dir, name)
+    try:
+        with open(path + '.sha256') as f:
+            checksum = f.read().strip()
+        if file_hash(path) == checksum:
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def save_download(name, source, cache_dir=DEFAULT_CACHE_DIR):
+    """Copy the file-like `source` into the cache as `name`."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, name)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(source, f)
+        checksum = file_hash(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    # Written last, so an interrupted download never looks intact
+    with open(path + '.sha256', 'w') as f:
+        f.write(checksum + '\n')
+    return path
+
+
+def download(name, cache_dir=DEFAULT_CACHE_DIR, base_url=None, timeout=30):
+    """Download `name` into the cache and record its checksum."""
+    url = (base_url or data_url()) + urllib.parse.quote(name)
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return save_download(name, response, cache_dir)
+
+
+def dataset_path(name, offline=None, data_dir=DATA_DIR,
+                 cache_dir=DEFAULT_CACHE_DIR):
+    """Return a local path for dataset `name`, e.g. 'chico.csv'."""
+    path = data_file_path(name, data_dir)
+    if os.path.exists(path):
+        return path
+    path = cached_path(name, cache_dir)
+    if path:
+        return path
+    if is_offline(offline):
+        raise DatasetError('Dataset "%s" is not in %s or the dataset cache, '
+                           'and offline mode is on.' % (name, data_dir))
+    try:
+        return download(name, cache_dir)
+    except OSError as e:
+        raise DatasetError('Could not download dataset "%s": %s'
+                           % (name, e)) from e
+
+
+def load_dataset(name, offline=None, **kwargs):
+    """Read dataset `name` into a DataFrame; `kwargs` go to read_csv().
+
+    Without `kwargs` the shared or columnar copy is used; both only hold
+    the default parse, so any read_csv() options mean parsing the CSV.
+    Either way the dataset's schema is applied.
+    """
+    import pandas as pd
+    path = dataset_path(name, offline)
+    schema = load_schema(name)
+    if kwargs:
+        return apply_schema(pd.read_csv(path, **kwargs), schema)
+    df = shared_frame(path)
+    if df is None:
+        df = ColumnarCache().read(path, schema)
+    return df
+
+
+def install(offline=None):
+    """Make `pandas.read_csv` load the book's data URLs with load_dataset()."""
+    import pandas as pd
+    read_csv = pd.read_csv
+    if getattr(read_csv, 'pythonbook_datasets', False):
+        return
+
+    @functools.wraps(read_csv)
+    def read_book_csv(filepath_or_buffer, *args, **kwargs):
+        name = dataset_name(filepath_or_buffer)
+        if name and not args:
+            return load_dataset(name, offline, **kwargs)
+        if name:
+            filepath_or_buffer = dataset_path(name, offline)
+        return read_csv(filepath_or_buffer, *args, **kwargs)
+
+    read_book_csv.pythonbook_datasets = True
+    pd.read_csv = read_book_csv
+
+
+def kernel_arguments():
+    """Kernel command line arguments that run install() at startup."""
+    return ['--IPKernelApp.exec_lines=%s' % KERNEL_SETUP]
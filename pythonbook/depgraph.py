@@ -0,0 +1,292 @@
+"""Static def/use analysis of code cells, for re-running only what changed.
+
+Each cell is parsed with `ast` to find the names it binds and the names it
+reads. The analysis errs on the side of re-running more cells than strictly
+needed:
+
+- a cell that reads a name depends on *every* earlier cell that binds it,
+  not just the most recent one;
+- calling a method on a name, or assigning to one of its items or
+  attributes (`df.dropna(inplace=True)`, `df['x'] = ...`), counts as
+  rebinding it, except for names bound by imports;
+- names used inside function and class bodies count as used by the cell
+  that defines them, and by every cell that uses the function or class,
+  so a global a function reads is found even if it is bound after the
+  function is defined;
+- calls into modules with hidden global state (`random`, `numpy.random`,
+  `scipy.stats`, whose `rvs` and resampling functions draw from numpy's
+  global RNG by default, matplotlib and seaborn, see `STATEFUL_MODULES`),
+  and any `.rvs()` call, e.g. on a frozen distribution, all read and write
+  one shared pseudo-name, so seeding the RNG or changing the current
+  figure re-runs every later cell that draws numbers or plots;
+- a cell that can't be parsed (cell magics, shell escapes mixed into
+  expressions, ...) is treated as reading and binding everything.
+
+It still can't see every dependency, e.g. names reached through `exec`,
+`globals()` or `getattr` with a computed name, or state hidden in modules
+not listed above; a full run is always the safe choice.
+"""
+
+import ast
+import difflib
+
+from pythonbook.notebooks import code_cells
+
+# Modules whose functions keep state between calls: the global RNGs, their
+# consumers, and pyplot's current figure
+STATEFUL_MODULES = ('random', 'numpy.random', 'scipy.stats', 'matplotlib',
+                    'seaborn', 'pylab')
+# Methods that draw from numpy's global RNG whatever they are called on
+STATEFUL_METHODS = ('rvs',)
+# Stands for that state in the def/use sets; not a valid Python name
+GLOBAL_STATE = '<global state>'
+
+
+class CellNames:
+
+    def __init__(self, defs=(), uses=(), modules=(), opaque=False,
+                 imports=None, calls=(), deferred=None):
+        self.defs = set(defs)
+        self.uses = set(uses)
+        self.modules = set(modules)
+        self.opaque = opaque
+        self.imports = imports or {} # name -> module or module.attribute
+        self.calls = set(calls) # dotted names called, as tuples
+        self.deferred = deferred or {} # function/class -> names its body reads
+
+
+def _strip_magics(source):
+    # Line magics and shell escapes don't bind Python names
+    lines = []
+    for line in source.splitlines():
+        if line.lstrip().startswith(('%', '!')):
+            lines.append('')
+        else:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def _base_name(node):
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+
+def _dotted(node):
+    # ('np', 'random', 'seed') for np.random.seed, None for anything else
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        return (node.id,) + tuple(reversed(parts))
+    return None
+
+
+def _body_uses(node):
+    return {child.id for child in ast.walk(node)
+            if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load)}
+
+
+def cell_names(source):
+    """Return the `CellNames` bound and read by one cell's source."""
+    if source.lstrip().startswith('%%'):
+        return CellNames(opaque=True)
+    try:
+        tree = ast.parse(_strip_magics(source))
+    except SyntaxError:
+        return CellNames(opaque=True)
+    defs, uses, modules, mutated = set(), set(), set(), set()
+    imports, calls, deferred = {}, set(), {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                uses.add(node.id)
+            else:
+                defs.add(node.id)
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                name = (alias.asname or alias.name).split('.')[0]
+                defs.add(name)
+                modules.add(name)
+                imports[name] = alias.name if alias.asname else name
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                name = alias.asname or alias.name
+                defs.add(name)
+                modules.add(name)
+                if node.module:
+                    imports[name] = node.module + '.' + alias.name
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                               ast.ClassDef)):
+            defs.add(node.name)
+            deferred[node.name] = _body_uses(node)
+        elif isinstance(node, (ast.Attribute, ast.Subscript)) \
+                and not isinstance(node.ctx, ast.Load):
+            mutated.add(_base_name(node))
+        elif isinstance(node, ast.Call):
+            dotted = _dotted(node.func)
+            if dotted:
+                calls.add(dotted)
+            if isinstance(node.func, ast.Attribute):
+                mutated.add(_base_name(node.func.value))
+    mutated.discard(None)
+    return CellNames(defs | mutated, uses, modules, imports=imports,
+                     calls=calls, deferred=deferred)
+
+
+def _is_stateful(module):
+    return any(module == name or module.startswith(name + '.')
+               for name in STATEFUL_MODULES)
+
+
+class DependencyGraph:
+    """Dependencies between the code cells of one notebook, by position."""
+
+    def __init__(self, sources):
+        self.cells = [cell_names(source) for source in sources]
+        modules, imports, deferred = set(), {}, {}
+        for cell in self.cells:
+            modules |= cell.modules
+            imports.update(cell.imports)
+            for name, body in cell.deferred.items():
+                deferred.setdefault(name, set()).update(body)
+        for cell in self.cells:
+            # Calling a function reads whatever its body reads, and so on
+            # for the functions that one calls
+            pending = cell.uses & set(deferred)
+            seen = set()
+            while pending:
+                name = pending.pop()
+                seen.add(name)
+                body = deferred[name]
+                cell.uses |= body
+                pending |= (body & set(deferred)) - seen
+            for dotted in cell.calls:
+                module = imports.get(dotted[0])
+                if dotted[-1] in STATEFUL_METHODS and len(dotted) > 1 \
+                        or module and _is_stateful(
+                            '.'.join((module,) + dotted[1:])):
+                    cell.defs.add(GLOBAL_STATE)
+                    cell.uses.add(GLOBAL_STATE)
+        self.upstream = []
+        for i, cell in enumerate(self.cells):
+            deps = set()
+            for j in range(i):
+                earlier = self.cells[j]
+                if cell.opaque or earlier.opaque:
+                    deps.add(j)
+                    continue
+                # Method calls on modules are not mutations of the module
+                defs = earlier.defs - (modules - earlier.modules)
+                if defs & cell.uses:
+                    deps.add(j)
+            self.upstream.append(deps)
+        self.downstream = [set() for _ in self.cells]
+        for i, deps in enumerate(self.upstream):
+            for j in deps:
+                self.downstream[j].add(i)
+
+    def _closure(self, start, edges):
+        seen = set(start)
+        stack = list(start)
+        while stack:
+            for other in edges[stack.pop()]:
+                if other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+        return seen
+
+    def affected_by(self, changed):
+        """`changed` cells plus every cell that depends on them."""
+        return self._closure(changed, self.downstream)
+
+    def needed_by(self, cells):
+        """Cells that must run first to rebuild the state `cells` read."""
+        return self._closure(cells, self.upstream) - set(cells)
+
+
+def changed_cells(old_hashes, new_hashes):
+    """Positions in `new_hashes` of cells that are new or edited.
+
+    Removing cells (which includes moving them) counts as editing every
+    cell after them: later cells may have read what the removed ones
+    defined, and the old sources are gone, so there is no telling which.
+    """
+    matcher = difflib.SequenceMatcher(a=old_hashes, b=new_hashes,
+                                      autojunk=False)
+    changed = set()
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ('replace', 'insert'):
+            changed.update(range(j1, j2))
+        if i2 - i1 > j2 - j1: # more cells went than came
+            changed.update(range(j2, len(new_hashes)))
+    return changed
+
+
+def plan_partial(sources, changed):
+    """Plan a partial run of a notebook whose `changed` code cells were edited.
+
+    Returns `(rerun, seed)`: the positions of code cells whose outputs must
+    be replaced, and those of unchanged upstream cells that only need to run
+    to rebuild the kernel state the rerun cells read, and keep their outputs.
+    """
+    graph = DependencyGraph(sources)
+    rerun = graph.affected_by(changed)
+    seed = graph.needed_by(rerun)
+    return rerun, seed
+
+
+def plan_resume(sources, first):
+    """Plan a run that continues a notebook from code cell `first`.
+
+    Like `plan_partial`, but every cell from `first` on is re-run, since
+    none of them completed last time.
+    """
+    graph = DependencyGraph(sources)
+    rerun = set(range(first, len(sources)))
+    seed = graph.needed_by(rerun)
+    return rerun, seed
+
+
+def mark_partial(nb, rerun, seed, skip_tag='skip-execution'):
+    """Prepare `nb` for a partial run planned by `plan_partial`.
+
+    Cells in neither set are tagged so nbclient skips them. Returns what
+    `unmark_partial` needs to put the seed cells' outputs back and remove
+    the tags again.
+    """
+    saved, tagged = {}, []
+    for i, cell in enumerate(code_cells(nb)):
+        if i in seed:
+            saved[i] = (cell.get('execution_count'), cell.outputs)
+        elif i not in rerun:
+            tags = cell.metadata.setdefault('tags', [])
+            if skip_tag not in tags:
+                tags.append(skip_tag)
+                tagged.append(i)
+    return saved, tagged
+
+
+def unmark_partial(nb, marks, skip_tag='skip-execution'):
+    """Undo `mark_partial` and renumber the execution counts in order."""
+    saved, tagged = marks
+    cells = code_cells(nb)
+    for i, (execution_count, outputs) in saved.items():
+        cells[i].execution_count = execution_count
+        cells[i].outputs = outputs
+    for i in tagged:
+        tags = cells[i].metadata['tags']
+        tags.remove(skip_tag)
+        if not tags:
+            del cells[i].metadata['tags']
+    count = 0
+    for cell in cells:
+        if cell.get('execution_count') is not None:
+            count += 1
+            cell.execution_count = count
+            for output in cell.outputs:
+                if 'execution_count' in output:
+                    output['execution_count'] = count
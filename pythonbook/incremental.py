@@ -0,0 +1,79 @@
+"""Track what each chapter was last executed against, for incremental builds.
+
+A chapter only needs re-executing when one of its inputs changes: its code
+cells (or kernel), the Data/ files it reads, or the Python environment it
+runs in. Everything else (outputs, glue values and figures) is kept in the
+notebook itself, which jupyter-book then renders without executing.
+"""
+
+import hashlib
+import importlib.metadata
+import json
+import os
+import sys
+
+from pythonbook.notebooks import (ROOT, code_cells, normalize_source,
+                                  kernel_name, data_fingerprint)
+
+DEFAULT_STATE_PATH = os.path.join(ROOT, '.nbcache', 'incremental.json')
+
+
+def _hash(payload):
+    encoded = json.dumps(payload, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def environment_fingerprint():
+    """Hash of the Python version and every installed package version."""
+    packages = sorted('%s==%s' % (dist.metadata['Name'].lower(), dist.version)
+                      for dist in importlib.metadata.distributions())
+    return _hash({'python': sys.version, 'packages': packages})
+
+
+def notebook_inputs(nb, environment):
+    sources = [normalize_source(cell.source) for cell in code_cells(nb)]
+    return {
+        'code': _hash({'kernel': kernel_name(nb), 'cells': sources}),
+        'data': data_fingerprint(nb),
+        'environment': environment,
+        # Per-cell hashes, to find which cells changed for partial runs
+        'cells': [_hash(source) for source in sources],
+    }
+
+
+def changed_inputs(old, new):
+    """Names of the inputs that differ between two `notebook_inputs`."""
+    if old is None:
+        return ['never executed']
+    return [name for name in ('code', 'data', 'environment')
+            if old.get(name) != new[name]]
+
+
+class ExecutionState:
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = os.path.abspath(path)
+        try:
+            with open(path) as f:
+                self.notebooks = json.load(f)
+        except (OSError, ValueError):
+            self.notebooks = {}
+
+    def previous(self, name):
+        return self.notebooks.get(name)
+
+    def changes(self, name, inputs):
+        return changed_inputs(self.notebooks.get(name), inputs)
+
+    def record(self, name, inputs):
+        self.notebooks[name] = inputs
+
+    def forget(self, name):
+        self.notebooks.pop(name, None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.notebooks, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,56 @@
+"""A run journal, so an interrupted run of run_notebooks.py can be resumed.
+
+The journal is rewritten after every notebook finishes. For each notebook it
+records the hash of the inputs it ran with (see `pythonbook.cache`) and
+whether it completed. For a notebook that failed part way through, it also
+records the first code cell that did not complete, so the next run can pick
+up from there instead of from the top.
+"""
+
+import json
+import os
+
+from pythonbook.notebooks import ROOT
+
+DEFAULT_JOURNAL_PATH = os.path.join(ROOT, '.nbcache', 'journal.json')
+
+
+class RunJournal:
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = os.path.abspath(path)
+        try:
+            with open(path) as f:
+                self.notebooks = json.load(f)
+        except (OSError, ValueError):
+            self.notebooks = {}
+
+    def reset(self):
+        self.notebooks = {}
+        self.save()
+
+    def completed(self, name, key):
+        entry = self.notebooks.get(name)
+        return bool(entry) and entry['key'] == key and entry['completed']
+
+    def resume_point(self, name, key):
+        """First code cell to run when resuming `name`, or None to start over.
+
+        Only valid while the inputs hash to the same `key`.
+        """
+        entry = self.notebooks.get(name)
+        if not entry or entry['key'] != key or entry['completed']:
+            return None
+        return entry.get('resume_from') or None
+
+    def record(self, name, key, completed, resume_from=None):
+        self.notebooks[name] = {'key': key, 'completed': completed,
+                                'resume_from': resume_from}
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.notebooks, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,109 @@
+"""A pool of kernels started ahead of time with the scientific stack imported.
+
+Almost every chapter begins by importing pandas, numpy, scipy, seaborn,
+matplotlib, statsmodels and pingouin, and for the short chapters starting a
+kernel and importing these takes longer than running the notebook. The pool
+keeps spare kernels that are started, and have imported those packages,
+while other notebooks run.
+
+The imports only populate `sys.modules`; no names are bound in the user
+namespace, so a chapter that forgets an import still fails. Kernels are never
+reused: each one is shut down after its notebook and replaced by a fresh one,
+so no state leaks between chapters.
+"""
+
+from collections import deque
+
+from jupyter_client import AsyncKernelManager, BlockingKernelClient
+from jupyter_core.utils import run_sync
+
+WARM_MODULES = [
+    'numpy',
+    'pandas',
+    'scipy.stats',
+    'matplotlib.pyplot',
+    'seaborn',
+    'statsmodels.api',
+    'statsmodels.formula.api',
+    'pingouin',
+]
+
+WARMUP_TEMPLATE = """
+def _warm_up():
+    import importlib
+    for name in %r:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+_warm_up()
+del _warm_up
+"""
+
+
+class KernelPool:
+    """Hand out warm kernels, keeping `size` spares starting in the background.
+
+    Use `acquire()` to take a started kernel manager, pass it to
+    `ExecutePreprocessor.preprocess(..., km=km)` and hand it back with
+    `release()`, which shuts it down.
+    """
+
+    def __init__(self, size=1, kernel_name='python3', cwd='.',
+                 modules=WARM_MODULES, startup_timeout=60, extra_arguments=()):
+        self.size = size
+        self.kernel_name = kernel_name
+        self.cwd = cwd
+        self.extra_arguments = list(extra_arguments)
+        self.warmup_code = WARMUP_TEMPLATE % (list(modules),)
+        self.startup_timeout = startup_timeout
+        self._spares = deque()
+        self.fill()
+
+    def _start(self):
+        km = AsyncKernelManager(kernel_name=self.kernel_name)
+        run_sync(km.start_kernel)(cwd=self.cwd,
+                                  extra_arguments=self.extra_arguments)
+        kc = BlockingKernelClient()
+        kc.load_connection_info(km.get_connection_info())
+        kc.start_channels()
+        # Don't wait for the imports here: the kernel works through them while
+        # the current notebook runs, and acquire() waits for the reply
+        msg_id = kc.execute(self.warmup_code, silent=False,
+                            store_history=False)
+        return km, kc, msg_id
+
+    def fill(self):
+        while len(self._spares) < self.size:
+            self._spares.append(self._start())
+
+    def acquire(self):
+        """Return a kernel manager whose kernel has finished warming up."""
+        if not self._spares:
+            self.fill()
+        km, kc, msg_id = self._spares.popleft()
+        # Start the replacement before blocking on this one
+        self.fill()
+        try:
+            # The warm-up request was queued before the kernel was listening,
+            # so its reply also tells us the kernel is ready
+            while True:
+                reply = kc.get_shell_msg(timeout=self.startup_timeout)
+                if reply['parent_header'].get('msg_id') == msg_id:
+                    break
+        except Exception:
+            self.release(km)
+            raise
+        finally:
+            kc.stop_channels()
+        return km
+
+    def release(self, km):
+        """Discard a kernel that has run a notebook."""
+        run_sync(km.shutdown_kernel)(now=True)
+
+    def shutdown(self):
+        while self._spares:
+            km, kc, _ = self._spares.popleft()
+            kc.stop_channels()
+            self.release(km)
@@ -0,0 +1,190 @@
+"""Datasets that are only read as far as they are used.
+
+`scan_dataset('harpo.csv')` returns a `LazyFrame` instead of a DataFrame.
+Selecting columns and filtering rows only records what is wanted; nothing
+is read until a result is asked for:
+
+    harpo = scan_dataset('harpo.csv')
+    anastasia = harpo.filter('tutor', '==', 'Anastasia')
+    anastasia['grade']            # a Series of one column
+    harpo[['grade']].collect()    # a DataFrame of one column
+
+The data comes from the dataset's columnar copy (see `pythonbook.columnar`),
+which is memory mapped, so only the pages of the selected and filtered
+columns are touched. Filters are evaluated on the Arrow columns, and only
+the rows that pass are converted to pandas. Results keep the row labels
+they would have had in the full DataFrame, so
+
+    scan_dataset(name).filter(column, op, value)[[columns]].collect()
+
+equals
+
+    df = pd.read_csv(url)
+    df.loc[df[column] op value, [columns]]
+
+Without pyarrow the full dataset is loaded and filtered with pandas, with
+the same results. `check()` asserts that equality for a few filters, on
+category and numeric columns:
+
+    python -c 'from pythonbook.lazy import check; check()'
+
+Filters are (column, op, value) triples, like the `filters` of
+`pandas.read_parquet`; op is one of ==, !=, <, <=, >, >=, in and not in.
+Several filters must all hold.
+"""
+
+import operator
+
+import numpy as np
+
+from pythonbook.columnar import ColumnarCache
+from pythonbook.datasets import dataset_path, load_dataset
+from pythonbook.schemas import load_schema
+
+PANDAS_OPS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda values, value: values.isin(value),
+    'not in': lambda values, value: ~values.isin(value),
+}
+
+
+def _arrow_mask(column, op, value):
+    import pyarrow
+    import pyarrow.compute as pc
+    if op in ('in', 'not in'):
+        mask = pc.is_in(column, value_set=pyarrow.array(list(value)))
+        return pc.invert(mask) if op == 'not in' else mask
+    function = {'==': pc.equal, '!=': pc.not_equal, '<': pc.less,
+                '<=': pc.less_equal, '>': pc.greater,
+                '>=': pc.greater_equal}[op]
+    # Nulls compare as null; like pandas, drop them
+    return pc.fill_null(function(column, value), False)
+
+
+class LazyFrame:
+
+    def __init__(self, name, columns=None, filters=(), offline=None):
+        self.name = name
+        self.offline = offline
+        self._columns = columns
+        self.filters = list(filters)
+
+    def __repr__(self):
+        return 'LazyFrame(%r, columns=%r, filters=%r)' % (
+            self.name, self._columns, self.filters)
+
+    def _table(self):
+        path = dataset_path(self.name, self.offline)
+        return ColumnarCache().table(path, load_schema(self.name))
+
+    @property
+    def columns(self):
+        """The selected columns; reads no data, only the table's schema."""
+        if self._columns is None:
+            table = self._table()
+            if table is None:
+                self._columns = list(load_dataset(self.name,
+                                                  self.offline).columns)
+            else:
+                self._columns = table.column_names
+        return self._columns
+
+    def select(self, *columns):
+        """Return a LazyFrame of only `columns`."""
+        missing = [column for column in columns if column not in self.columns]
+        if missing:
+            raise KeyError('%s not in %s' % (missing, self.name))
+        return LazyFrame(self.name, list(columns), self.filters, self.offline)
+
+    def filter(self, column, op, value):
+        """Return a LazyFrame of the rows where `column op value`."""
+        if op not in PANDAS_OPS:
+            raise ValueError('Unknown filter operator %r' % op)
+        # Rows can be filtered on columns that are not selected
+        if column not in LazyFrame(self.name, offline=self.offline).columns:
+            raise KeyError('%r not in %s' % (column, self.name))
+        return LazyFrame(self.name, self._columns,
+                         self.filters + [(column, op, value)], self.offline)
+
+    def __getitem__(self, key):
+        # A column name gives a Series, as with a DataFrame; a list of
+        # names stays lazy
+        if isinstance(key, str):
+            return self.select(key).collect()[key]
+        return self.select(*key)
+
+    def __len__(self):
+        return len(self.select().collect())
+
+    def head(self, n=5):
+        return self.collect(limit=n)
+
+    def collect(self, limit=None):
+        """Read the selected columns of the rows that pass every filter,
+        the first `limit` of them if given, into a DataFrame."""
+        import pandas as pd
+        columns = self.columns
+        table = self._table()
+        if table is None:
+            df = load_dataset(self.name, self.offline)
+            mask = pd.Series(True, index=df.index)
+            for column, op, value in self.filters:
+                mask &= PANDAS_OPS[op](df[column], value).fillna(False)
+            return df.loc[mask, columns].iloc[:limit]
+
+        needed = list(dict.fromkeys(columns + [column for column, _, _
+                                               in self.filters]))
+        table = table.select(needed)
+        rows = None
+        if self.filters:
+            import pyarrow.compute as pc
+            mask = None
+            for column, op, value in self.filters:
+                condition = _arrow_mask(table[column], op, value)
+                mask = condition if mask is None else pc.and_(mask,
+                                                              condition)
+            rows = pc.indices_nonzero(mask).to_numpy()
+            table = table.filter(mask)
+        if limit is not None:
+            table = table.slice(0, limit)
+            if rows is not None:
+                rows = rows[:limit]
+        df = table.select(columns).to_pandas()
+        df.index = pd.RangeIndex(len(df)) if rows is None \
+            else pd.Index(rows.astype(np.int64))
+        return df
+
+
+def scan_dataset(name, offline=None):
+    """Return dataset `name`, e.g. 'harpo.csv', as a LazyFrame."""
+    return LazyFrame(name, offline=offline)
+
+
+# (dataset, filters, columns) for check(). harpo.csv's tutor column is a
+# category, which Arrow stores dictionary encoded
+CHECKS = [
+    ('harpo.csv', [('tutor', '==', 'Anastasia')], ['grade', 'tutor']),
+    ('harpo.csv', [('grade', '>', 70)], ['tutor']),
+    ('harpo.csv', [('tutor', 'in', ['Bernadette']), ('grade', '<=', 70)],
+     ['grade']),
+]
+
+
+def check(cases=CHECKS, offline=None):
+    """Assert that each case's LazyFrame result equals the same selection
+    from the full DataFrame with `df.loc`, values, dtypes and row labels."""
+    import pandas as pd
+    for name, filters, columns in cases:
+        df = load_dataset(name, offline)
+        mask = pd.Series(True, index=df.index)
+        lazy = scan_dataset(name, offline)
+        for column, op, value in filters:
+            mask &= PANDAS_OPS[op](df[column], value)
+            lazy = lazy.filter(column, op, value)
+        pd.testing.assert_frame_equal(lazy[columns].collect(),
+                                      df.loc[mask, columns])
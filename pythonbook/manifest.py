@@ -0,0 +1,173 @@
+"""The data manifest, and the preflight check run before any kernel starts.
+
+`Data/manifest.json` lists the size and sha256 of every data file the
+chapters read, and which files each chapter reads. Datasets the chapters
+read from the book's URLs that are not in `Data/` (they are only on the
+data server) are listed under `remote`, with the size and sha256 of the
+downloaded file. It is written by `run_notebooks.py --update-manifest`,
+and `check_manifest` makes sure every entry still resolves.
+
+`preflight` looks at the data files the notebooks about to run refer to,
+in parallel:
+
+- the book's raw.githubusercontent.com URLs and bare file names are
+  resolved with `pythonbook.datasets.dataset_path`, which downloads
+  anything that is not in `Data/` or the dataset cache (unless offline);
+- files in `Data/` and remote datasets are checked against the size and
+  checksum recorded in the manifest; a remote dataset whose checksum has
+  not been recorded yet (the manifest was updated offline) has it recorded
+  in `manifest` from its first download;
+- other paths, e.g. absolute paths on someone's laptop, must exist.
+
+It returns a list of problems, so a missing input stops the build before
+it starts instead of part way through a chapter.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pythonbook.datasets import DatasetError, dataset_name, dataset_path
+from pythonbook.notebooks import (ROOT, DATA_DIR, data_file_path,
+                                  data_file_references, file_hash)
+
+DEFAULT_MANIFEST_PATH = os.path.join(DATA_DIR, 'manifest.json')
+
+
+def load_manifest(path=DEFAULT_MANIFEST_PATH):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'datasets': {}, 'remote': {}, 'chapters': {}}
+    manifest.setdefault('remote', {})
+    return manifest
+
+
+def file_entry(path):
+    return {'size': os.path.getsize(path), 'sha256': file_hash(path)}
+
+
+def save_manifest(manifest, path=DEFAULT_MANIFEST_PATH):
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+        f.write('\n')
+
+
+def reference_name(reference):
+    """Return the dataset a reference in a notebook names, or None.
+
+    Book URLs and bare file names name a dataset; other paths don't.
+    """
+    name = dataset_name(reference)
+    if name:
+        return name
+    if '://' not in reference and os.path.basename(reference) == reference:
+        return reference
+    return None
+
+
+def update_manifest(manifest, chapters, data_dir=DATA_DIR, offline=None):
+    """Record the data files `chapters` (chapter -> notebook) read.
+
+    Chapters not in `chapters` keep their entries. Remote datasets are
+    downloaded, if they are not in the cache, to record their checksums;
+    one that can't be keeps its old entry, or an empty one.
+    """
+    for chapter, nb in chapters.items():
+        manifest['chapters'][chapter] = data_file_references(nb)
+    names = set()
+    for references in manifest['chapters'].values():
+        names.update(filter(None, map(reference_name, references)))
+    datasets, remote = {}, {}
+    for name in sorted(names):
+        path = data_file_path(name, data_dir)
+        if os.path.exists(path):
+            datasets[name] = file_entry(path)
+            continue
+        try:
+            remote[name] = file_entry(dataset_path(name, offline,
+                                                   data_dir=data_dir))
+        except DatasetError:
+            remote[name] = manifest['remote'].get(name, {})
+    manifest['datasets'] = datasets
+    manifest['remote'] = remote
+    return manifest
+
+
+def check_manifest(manifest, data_dir=DATA_DIR):
+    """Return a list of problems with the manifest itself: recorded
+    datasets missing from `data_dir`, and datasets a chapter reads that
+    are neither recorded nor listed as remote."""
+    problems = []
+    for name in sorted(manifest['datasets']):
+        if not os.path.exists(data_file_path(name, data_dir)):
+            problems.append('%s is in the data manifest but not in Data/'
+                            % name)
+    known = set(manifest['datasets']) | set(manifest['remote'])
+    for chapter, references in sorted(manifest['chapters'].items()):
+        for name in filter(None, map(reference_name, references)):
+            if name not in known:
+                problems.append('%s, read by %s, is not in the data '
+                                'manifest; run with --update-manifest'
+                                % (name, chapter))
+    return problems
+
+
+def check_dataset(name, manifest, run_path='.', offline=None):
+    if os.path.exists(os.path.join(run_path, name)):
+        return None
+    try:
+        path = dataset_path(name, offline)
+    except DatasetError as e:
+        return str(e)
+    entry = manifest['datasets'].get(name)
+    if entry is None:
+        entry = manifest['remote'].get(name)
+        if entry is None:
+            return None
+        if not entry:
+            # First download since the manifest was updated offline
+            entry.update(file_entry(path))
+            return None
+    if os.path.getsize(path) != entry['size'] \
+            or file_hash(path) != entry['sha256']:
+        return ('%s does not match the checksum in the data manifest; if it '
+                'was changed on purpose, run with --update-manifest'
+                % os.path.relpath(path, ROOT))
+    return None
+
+
+def check_path(reference, run_path='.'):
+    if '://' in reference:
+        return None # Not ours to check
+    if os.path.exists(os.path.join(run_path, reference)):
+        return None
+    problem = '%s does not exist' % reference
+    if os.path.exists(data_file_path(os.path.basename(reference))):
+        problem += ('; it is in Data/, so read it from the book\'s Data/ URL '
+                    'instead')
+    return problem
+
+
+def preflight(notebooks, manifest, run_path='.', offline=None, jobs=8):
+    """Check and prefetch every data file `notebooks` (name -> nb) read.
+
+    Returns a list of (reference, [notebook names], problem) triples.
+    """
+    readers = {}
+    for n, nb in notebooks.items():
+        for reference in data_file_references(nb):
+            readers.setdefault(reference, []).append(n)
+
+    def check(reference):
+        name = reference_name(reference)
+        if name:
+            return check_dataset(name, manifest, run_path, offline)
+        return check_path(reference, run_path)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(check, sorted(readers)))
+    return [(reference, readers[reference], problem)
+            for reference, problem in zip(sorted(readers), results)
+            if problem]
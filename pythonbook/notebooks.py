@@ -0,0 +1,71 @@
+"""Small helpers for inspecting chapter notebooks."""
+
+import hashlib
+import os
+import re
+
+# Repository root and the directory that holds the book's data files
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'Data')
+SCHEMA_DIR = os.path.join(DATA_DIR, 'schemas') # see pythonbook.schemas
+
+# String literals in code cells that look like data files, either local
+# paths or the raw.githubusercontent.com URLs used throughout the chapters
+DATA_FILE_RE = re.compile(r'''['"]([^'"\n]+\.(?:csv|txt|xlsx|json))['"]''')
+
+
+def code_cells(nb):
+    return [cell for cell in nb.cells if cell.cell_type == 'code']
+
+
+def normalize_source(source):
+    # Trailing whitespace and blank lines don't change what a cell does
+    lines = [line.rstrip() for line in source.strip().splitlines()]
+    return '\n'.join(lines)
+
+
+def kernel_name(nb, default='python3'):
+    return nb.metadata.get('kernelspec', {}).get('name', default)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def data_file_references(nb):
+    """Return the sorted paths and URLs of data files named in `nb`'s code."""
+    references = set()
+    for cell in code_cells(nb):
+        for match in DATA_FILE_RE.finditer(cell.source):
+            references.add(match.group(1))
+    return sorted(references)
+
+
+def referenced_data_files(nb):
+    """Return the sorted basenames of data files named in `nb`'s code."""
+    return sorted({os.path.basename(reference)
+                   for reference in data_file_references(nb)})
+
+
+def data_file_path(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, name)
+
+
+def data_fingerprint(nb, data_dir=DATA_DIR):
+    """Map each data file `nb` reads to its content hash, or None if missing.
+
+    A data file's schema, if it has one, is included as `schemas/<name>`.
+    """
+    fingerprint = {}
+    for name in referenced_data_files(nb):
+        path = data_file_path(name, data_dir)
+        fingerprint[name] = file_hash(path) if os.path.exists(path) else None
+        schema = os.path.join(data_dir, 'schemas',
+                              os.path.splitext(name)[0] + '.json')
+        if os.path.exists(schema):
+            fingerprint['schemas/' + name] = file_hash(schema)
+    return fingerprint
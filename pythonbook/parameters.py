@@ -0,0 +1,75 @@
+"""Run chapters with scaled-down simulation sizes.
+
+A chapter declares its simulation sizes in a code cell tagged `parameters`
+(the papermill convention), e.g.
+
+    replications = 10000
+    beta_draws = 50000
+
+and uses those names instead of literal sizes. To run the chapter with a
+different profile, `inject_parameters` adds a cell tagged
+`injected-parameters` right after it that rebinds every integer parameter,
+scaled by the profile's factor. The parameters cell should also be tagged
+`hide-input`, so readers can still see the sizes the book used; the
+injected cell is tagged `remove-cell`, though it is only ever written to
+preview outputs.
+"""
+
+import ast
+
+import nbformat
+
+PROFILES = {
+    'release': 1.0,
+    'preview': 0.01,
+}
+
+
+def find_parameters(nb):
+    """Return the index of `nb`'s parameters cell and its literal values."""
+    for index, cell in enumerate(nb.cells):
+        if cell.cell_type == 'code' \
+                and 'parameters' in cell.metadata.get('tags', []):
+            values = {}
+            for node in ast.parse(cell.source).body:
+                if isinstance(node, ast.Assign) and len(node.targets) == 1 \
+                        and isinstance(node.targets[0], ast.Name):
+                    try:
+                        values[node.targets[0].id] = \
+                            ast.literal_eval(node.value)
+                    except ValueError:
+                        pass # Not a literal, leave it alone
+            return index, values
+    return None, {}
+
+
+def scaled_parameters(values, scale):
+    # Only integer sizes are scaled; never scale a size down to nothing
+    scaled = {}
+    for name, value in values.items():
+        if isinstance(value, int) and not isinstance(value, bool):
+            scaled[name] = max(1, int(round(value * scale)))
+    return scaled
+
+
+def inject_parameters(nb, scale):
+    """Insert a cell after the parameters cell scaling its integer sizes.
+
+    Returns the injected values, or an empty dict if `nb` has no parameters
+    cell, `scale` is 1 or parameters were already injected (e.g. `nb` is the
+    output of an earlier preview run).
+    """
+    index, values = find_parameters(nb)
+    if index is None or scale == 1 or any(
+            'injected-parameters' in cell.metadata.get('tags', [])
+            for cell in nb.cells):
+        return {}
+    scaled = scaled_parameters(values, scale)
+    lines = ['# Injected parameters (scale %g)' % scale]
+    lines += ['%s = %r' % (name, value) for name, value in scaled.items()]
+    cell = nbformat.v4.new_code_cell('\n'.join(lines))
+    cell.metadata['tags'] = ['injected-parameters', 'remove-cell']
+    if nb.nbformat_minor < 5:
+        del cell['id']
+    nb.cells.insert(index + 1, cell)
+    return scaled
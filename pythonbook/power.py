@@ -0,0 +1,141 @@
+"""Power of the binomial test, over whole grids of parameters at once.
+
+The hypothesis testing chapter draws power curves by calling
+`binom.cdf` once per value of theta or of N. Here the rejection region of
+the exact binomial test of theta = p0 is found once per (N, alpha) and
+cached, and the probability of landing in it is evaluated with single
+broadcast calls to scipy:
+
+    power_grid(theta=np.linspace(0, 1, 201), n=range(1, 1001),
+               alpha=[.01, .05, .1])
+
+is a (201, 1000, 3) array of the probabilities of rejecting the null.
+
+Rejection regions are exact: the largest regions whose probability under
+the null is at most alpha, split evenly between the tails for a
+two-sided test.
+"""
+
+import warnings
+
+import numpy as np
+
+ALTERNATIVES = ('two-sided', 'greater', 'less')
+
+# (n, alpha, p0, alternative) -> (lower, upper), see rejection_region()
+_regions = {}
+
+
+def _step(bound, too_far, step):
+    # Move each bound by `step` for as long as too_far(bound) says to
+    while True:
+        moving = too_far(bound)
+        if not moving.any():
+            return bound
+        bound = np.where(moving, bound + step, bound)
+
+
+def _find_regions(n, alpha, p0, alternative):
+    # Rejection regions for arrays of n and alpha, in broadcast calls. ppf
+    # and isf are only a first guess, as they are not exact for very small
+    # tails; each bound is then stepped until its tail condition holds
+    from scipy.stats import binom
+    tail = alpha / 2 if alternative == 'two-sided' else alpha
+    # Any region has some probability under the null, even if it
+    # underflows, so a zero tail has none
+    empty = tail <= 0
+    lower = np.full(n.shape, -1)
+    upper = n + 1
+    if alternative != 'greater':
+        # The largest lower with P(X <= lower) <= tail
+        with warnings.catch_warnings():
+            # Boost warns where it gives up; the guess is corrected below
+            warnings.simplefilter('ignore', RuntimeWarning)
+            guess = np.nan_to_num(binom.ppf(tail, n, p0), nan=-1)
+        lower = np.clip(guess, -1, n).astype(int)
+        lower = _step(lower, lambda k: (k >= 0)
+                      & (binom.cdf(k, n, p0) > tail), -1)
+        lower = _step(lower, lambda k: ~empty & (k < n)
+                      & (binom.cdf(k + 1, n, p0) <= tail), 1)
+        lower = np.where(empty, -1, lower)
+    if alternative != 'less':
+        # The smallest upper with P(X >= upper) <= tail
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            guess = np.nan_to_num(binom.isf(tail, n, p0), nan=n) + 1
+        upper = np.clip(guess, 0, n + 1).astype(int)
+        upper = _step(upper, lambda k: (k <= n)
+                      & (binom.sf(k - 1, n, p0) > tail), 1)
+        upper = _step(upper, lambda k: ~empty & (k > 0)
+                      & (binom.sf(k - 2, n, p0) <= tail), -1)
+        upper = np.where(empty, n + 1, upper)
+    return lower, upper
+
+
+def rejection_regions(n, alpha=0.05, p0=0.5, alternative='two-sided'):
+    """Return arrays (lower, upper): the test rejects when X <= lower or
+    X >= upper. A tail without a region, e.g. because alpha is smaller
+    than the probability of the most extreme outcome, gets -1 or n + 1.
+
+    `n` and `alpha` broadcast against each other. Regions are cached, so
+    each (n, alpha) is only worked out once.
+    """
+    if alternative not in ALTERNATIVES:
+        raise ValueError('alternative must be one of %s' % (ALTERNATIVES,))
+    if not 0 <= p0 <= 1:
+        raise ValueError('p0 must be between 0 and 1')
+    n, alpha = np.broadcast_arrays(np.asarray(n, dtype=int),
+                                   np.asarray(alpha, dtype=float))
+    if np.any(n < 0):
+        raise ValueError('n must not be negative')
+    if not np.all((alpha >= 0) & (alpha <= 1)):
+        raise ValueError('alpha must be between 0 and 1')
+    pairs, index = np.unique(np.stack([n.ravel(), alpha.ravel()], axis=-1),
+                             axis=0, return_inverse=True)
+    keys = [(int(size), float(level), p0, alternative)
+            for size, level in pairs]
+    missing = [key for key in keys if key not in _regions]
+    if missing:
+        sizes = np.array([key[0] for key in missing])
+        levels = np.array([key[1] for key in missing])
+        lower, upper = _find_regions(sizes, levels, p0, alternative)
+        _regions.update(zip(missing, zip(lower.tolist(), upper.tolist())))
+    regions = np.array([_regions[key] for key in keys]).reshape(-1, 2)
+    index = index.ravel()
+    return (regions[index, 0].reshape(n.shape),
+            regions[index, 1].reshape(n.shape))
+
+
+def rejection_region(n, alpha=0.05, p0=0.5, alternative='two-sided'):
+    """`rejection_regions` for a single n and alpha, as two ints."""
+    lower, upper = rejection_regions(n, alpha, p0, alternative)
+    return int(lower), int(upper)
+
+
+def rejection_probability(theta, n, lower, upper):
+    """Probability that X ~ Binomial(n, theta) is <= lower or >= upper.
+
+    All arguments broadcast against each other.
+    """
+    from scipy.stats import binom
+    return binom.cdf(lower, n, theta) + binom.sf(np.asarray(upper) - 1, n,
+                                                 theta)
+
+
+def power(theta, n, alpha=0.05, p0=0.5, alternative='two-sided'):
+    """Probability that the exact binomial test of p0 rejects the null
+    when the true probability is `theta`, for samples of size `n`.
+
+    `theta`, `n` and `alpha` broadcast against each other.
+    """
+    lower, upper = rejection_regions(n, alpha, p0, alternative)
+    return rejection_probability(theta, n, lower, upper)
+
+
+def power_grid(theta, n, alpha=0.05, p0=0.5, alternative='two-sided'):
+    """Return `power` on the full grid: an array of shape
+    (len(theta), len(n), len(alpha))."""
+    theta = np.asarray(theta, dtype=float).reshape(-1, 1, 1)
+    n = np.asarray(n, dtype=int).reshape(1, -1, 1)
+    alpha = np.asarray(alpha, dtype=float).reshape(1, 1, -1)
+    return power(theta, n, alpha, p0, alternative)
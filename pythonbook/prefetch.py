@@ -0,0 +1,140 @@
+"""Download every dataset the notebooks will need, all at once.
+
+A dataset that is neither in `Data/` nor in the dataset cache is otherwise
+downloaded by the first `read_csv` that asks for it, in the middle of a
+chapter, one file after another. `prefetch_notebooks` finds all the book's
+data URLs in a set of notebooks and downloads the missing ones into the
+cache before any kernel starts:
+
+- downloads run concurrently, on `connections` workers driven by asyncio;
+- each worker keeps one HTTP/1.1 connection to the data server open and
+  reuses it for file after file, so there is one TLS handshake per worker
+  rather than one per file;
+- files go through `pythonbook.datasets.save_download`, so they are
+  checksummed and renamed into place exactly like any other download.
+
+The data server is `pythonbook.datasets.data_url()`, so a local stand-in
+can be used for testing:
+
+    python -m http.server -d Data 8000 &
+    python run_notebooks.py --data-url http://localhost:8000/ ...
+"""
+
+import asyncio
+import http.client
+import os
+import urllib.parse
+
+from pythonbook.datasets import (DEFAULT_CACHE_DIR, DatasetError, cached_path,
+                                 data_url, dataset_name, save_download)
+from pythonbook.notebooks import DATA_DIR, data_file_path, data_file_references
+
+DEFAULT_CONNECTIONS = 4
+
+
+def remote_datasets(notebooks):
+    """Return the datasets `notebooks` (name -> nb) read from book URLs."""
+    names = set()
+    for nb in notebooks.values():
+        names.update(filter(None, map(dataset_name,
+                                      data_file_references(nb))))
+    return sorted(names)
+
+
+def missing_datasets(names, data_dir=DATA_DIR, cache_dir=DEFAULT_CACHE_DIR):
+    return [name for name in names
+            if not os.path.exists(data_file_path(name, data_dir))
+            and not cached_path(name, cache_dir)]
+
+
+class _Connection:
+    """One persistent connection to the data server, used by one worker."""
+
+    def __init__(self, url, timeout):
+        self.url = urllib.parse.urlsplit(url)
+        self.timeout = timeout
+        self.connection = None
+
+    def _connect(self):
+        if self.url.scheme == 'https':
+            return http.client.HTTPSConnection(self.url.netloc,
+                                               timeout=self.timeout)
+        return http.client.HTTPConnection(self.url.netloc,
+                                          timeout=self.timeout)
+
+    def fetch(self, name, cache_dir):
+        path = self.url.path + urllib.parse.quote(name)
+        # A kept-alive connection the server has since closed fails on first
+        # use; that, and only that, is worth one retry
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self._connect()
+            try:
+                self.connection.request('GET', path)
+                response = self.connection.getresponse()
+            except ConnectionError:
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if response.status != 200:
+                response.read()
+                raise DatasetError('Could not download dataset "%s": HTTP %d '
+                                   '%s' % (name, response.status,
+                                           response.reason))
+            return save_download(name, response, cache_dir)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+async def prefetch(names, cache_dir=DEFAULT_CACHE_DIR, base_url=None,
+                   connections=DEFAULT_CONNECTIONS, timeout=30):
+    """Download datasets `names` into the cache, `connections` at a time.
+
+    Returns a dict of name -> error message for the ones that failed.
+    """
+    base_url = base_url or data_url()
+    queue = asyncio.Queue()
+    for name in names:
+        queue.put_nowait(name)
+    errors = {}
+
+    async def worker():
+        connection = _Connection(base_url, timeout)
+        try:
+            while not queue.empty():
+                name = queue.get_nowait()
+                try:
+                    # http.client blocks, so each request runs in a thread;
+                    # a worker's requests still go one after another over
+                    # its own connection
+                    await asyncio.to_thread(connection.fetch, name, cache_dir)
+                except DatasetError as e:
+                    errors[name] = str(e)
+                except (OSError, http.client.HTTPException) as e:
+                    connection.close()
+                    errors[name] = ('Could not download dataset "%s": %s'
+                                    % (name, e))
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(worker() for _ in range(min(connections,
+                                                       len(names)))))
+    return errors
+
+
+def prefetch_notebooks(notebooks, data_dir=DATA_DIR,
+                       cache_dir=DEFAULT_CACHE_DIR, base_url=None,
+                       connections=DEFAULT_CONNECTIONS):
+    """Download the missing datasets `notebooks` (name -> nb) read.
+
+    Returns (names downloaded, dict of name -> error).
+    """
+    names = missing_datasets(remote_datasets(notebooks), data_dir, cache_dir)
+    if not names:
+        return [], {}
+    errors = asyncio.run(prefetch(names, cache_dir, base_url, connections))
+    return [name for name in names if name not in errors], errors
@@ -0,0 +1,123 @@
+"""Per-cell wall time, CPU time and peak memory for notebook execution.
+
+`ProfilingExecutePreprocessor` asks the kernel for its CPU time and memory
+high-water mark before and after every code cell, using silent requests that
+leave no trace in the notebook or in its namespace. On Linux the high-water
+mark is reset before each cell, so `peak_rss` is the peak reached while that
+cell ran; elsewhere it is the kernel's peak so far.
+"""
+
+import ast
+import csv
+import json
+import os
+import time
+
+from nbconvert.preprocessors import ExecutePreprocessor
+
+FIELDS = ['notebook', 'cell', 'execution_count', 'wall_time', 'cpu_time',
+          'peak_rss', 'source']
+
+# Sent with every probe; the function removes itself from the user's
+# namespace as soon as it is called
+PROBE_SETUP = """
+def _pythonbook_probe(reset=False):
+    import resource, sys, time
+    globals().pop('_pythonbook_probe', None)
+    cpu = time.process_time()
+    try:
+        with open('/proc/self/status') as f:
+            peak = [int(line.split()[1]) * 1024 for line in f
+                    if line.startswith('VmHWM:')][0]
+        if reset:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+    except (OSError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            peak *= 1024
+    return cpu, peak
+"""
+
+
+class ProfilingExecutePreprocessor(ExecutePreprocessor):
+    """ExecutePreprocessor that records a timing row for every code cell."""
+
+    def preprocess(self, nb, resources=None, km=None):
+        self.cell_profiles = []
+        return super().preprocess(nb, resources, km)
+
+    def _probe(self, reset=False):
+        msg_id = self.kc.execute(
+            PROBE_SETUP, silent=True, store_history=False,
+            user_expressions={'probe': '_pythonbook_probe(%r)' % reset})
+        reply = self.wait_for_reply(msg_id)
+        result = reply['content']['user_expressions']['probe']
+        if result.get('status') != 'ok':
+            return None, None
+        return ast.literal_eval(result['data']['text/plain'])
+
+    def preprocess_cell(self, cell, resources, index):
+        if cell.cell_type != 'code' or not cell.source.strip() \
+                or self.skip_cells_with_tag in cell.metadata.get('tags', []):
+            return super().preprocess_cell(cell, resources, index)
+        cpu_before, _ = self._probe(reset=True)
+        start = time.perf_counter()
+        # A cell that raised (an error, a timeout, a dead kernel) gets no
+        # row: probing a kernel in that state could block or hide the error
+        result = super().preprocess_cell(cell, resources, index)
+        wall_time = time.perf_counter() - start
+        cpu_after, peak_rss = self._probe()
+        cpu_time = None
+        if cpu_before is not None and cpu_after is not None:
+            cpu_time = cpu_after - cpu_before
+        self.cell_profiles.append({
+            'cell': index,
+            'execution_count': cell.get('execution_count'),
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            'peak_rss': peak_rss,
+            'source': cell.source.strip().splitlines()[0][:80],
+        })
+        return result
+
+
+def save_notebook_profile(path, notebook, cell_profiles):
+    rows = [dict(row, notebook=notebook) for row in cell_profiles]
+    with open(path, 'w') as f:
+        json.dump(rows, f)
+
+
+def load_profiles(paths):
+    rows = []
+    for path in paths:
+        if os.path.exists(path):
+            with open(path) as f:
+                rows.extend(json.load(f))
+    return rows
+
+
+def write_report(rows, directory):
+    """Write all rows to profile.json and profile.csv in `directory`."""
+    with open(os.path.join(directory, 'profile.json'), 'w') as f:
+        json.dump(rows, f, indent=1)
+    with open(os.path.join(directory, 'profile.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def format_summary(rows, top=10):
+    """Return a table of the `top` slowest cells by wall time."""
+    lines = ['%-32s %5s %9s %9s %9s  %s' % ('notebook', 'cell', 'wall (s)',
+                                            'cpu (s)', 'peak MB', 'source')]
+    ranked = sorted(rows, key=lambda row: row['wall_time'], reverse=True)
+    for row in ranked[:top]:
+        cpu = '%9.2f' % row['cpu_time'] if row['cpu_time'] is not None \
+            else '%9s' % '-'
+        peak = '%9.1f' % (row['peak_rss'] / 2**20) if row['peak_rss'] \
+            else '%9s' % '-'
+        lines.append('%-32s %5d %9.2f %s %s  %s' % (
+            row['notebook'][-32:], row['cell'], row['wall_time'], cpu, peak,
+            row['source']))
+    return '\n'.join(lines)
@@ -0,0 +1,212 @@
+"""Sampling distributions, simulated a block of samples at a time.
+
+The estimation chapter shows what the mean (or maximum, or standard
+deviation) of a sample looks like over many replications of an experiment.
+Drawing each sample with its own call to numpy and reducing it with the
+`statistics` module takes seconds for 10,000 replications. Here all the
+samples of one size are drawn as the rows of a single 2-D array and reduced
+along its rows:
+
+    means = sampling_distribution('normal', 5, 10000, 'mean',
+                                  loc=100, scale=15)
+
+draws a (10000, 5) block and returns the 10,000 sample means. A list of
+sizes returns a dict of size -> statistics. The distribution can also be
+any scipy.stats distribution, so the central limit theorem can be shown
+for skewed ones:
+
+    sample_means = sampling_distribution(stats.beta(2, 1), 8, 50000)
+
+Blocks are drawn `chunk_size` values at a time, so memory stays bounded at
+any number of replications; since the chunks come from one generator in
+order, the results do not depend on the chunk size. Given a seed and an
+`ArtifactStore` (see `pythonbook.artifacts`), results for a named
+distribution and statistic are stored as `.npy` files and memory mapped,
+read-only, on later calls instead of being simulated again.
+
+`confidence_intervals` simulates experiments the same way and gives each
+one's t confidence interval, at one or several confidence levels, and
+`coverage` says how many of them contain the true mean and which miss.
+`running_proportions` follows the proportion of heads in many runs of coin
+flips at once, for the law of large numbers.
+"""
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 2 ** 22 # values drawn at once, 32 MB of float64
+DEFAULT_POINTS = 1000 # points per trajectory from running_proportions
+
+STATISTICS = {
+    'mean': lambda samples: samples.mean(axis=1),
+    'median': lambda samples: np.median(samples, axis=1),
+    'max': lambda samples: samples.max(axis=1),
+    'min': lambda samples: samples.min(axis=1),
+    'sd': lambda samples: samples.std(axis=1, ddof=1),
+    'var': lambda samples: samples.var(axis=1, ddof=1),
+}
+
+
+def _reducer(statistic):
+    if isinstance(statistic, str):
+        return STATISTICS[statistic]
+    if isinstance(statistic, np.ufunc):
+        return lambda samples: statistic.reduce(samples, axis=1)
+    # Anything else takes numpy's axis argument, e.g. scipy.stats.skew
+    return lambda samples: statistic(samples, axis=1)
+
+
+def sample_blocks(rng, distribution, n, replications,
+                  chunk_size=DEFAULT_CHUNK_SIZE, dtype=None, **params):
+    """Yield `replications` samples of size `n` from `distribution` as the
+    rows of 2-D blocks of at most `chunk_size` values.
+
+    `distribution` is a `numpy.random.Generator` method such as 'normal',
+    or a scipy.stats distribution such as `stats.beta(2, 1)`.
+    """
+    if isinstance(distribution, str):
+        draw = getattr(rng, distribution)
+    else:
+        def draw(size, **params):
+            return distribution.rvs(size=size, random_state=rng, **params)
+    rows = max(1, chunk_size // n)
+    for start in range(0, replications, rows):
+        block = draw(size=(min(rows, replications - start), n), **params)
+        # e.g. dtype=int truncates, like the chapters' .astype(int)
+        yield block if dtype is None else block.astype(dtype)
+
+
+def sampling_distribution(distribution, n, replications, statistic='mean',
+                          seed=None, dtype=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                          store=None, **params):
+    """Return `statistic` of each of `replications` samples of size `n`.
+
+    `distribution` and `params` name a `numpy.random.Generator` method and
+    its arguments, e.g. 'normal', loc=100, scale=15, or `distribution` is a
+    scipy.stats distribution, e.g. stats.beta(2, 1). `statistic` is 'mean',
+    'median', 'max', 'min', 'sd', 'var' (both with ddof=1), a ufunc such as
+    np.maximum, or a function taking an `axis` argument. `dtype` converts
+    the draws before the statistic is taken.
+
+    If `n` is a list of sizes, returns a dict of size -> array. Each size
+    has its own random stream, derived from `seed`.
+
+    With a `store` and a `seed`, and `distribution` and `statistic` given
+    by name, each size's array comes from the store if it is there, and
+    is put there otherwise; those arrays are read-only.
+    """
+    sizes = [n] if np.isscalar(n) else list(n)
+    reduce = _reducer(statistic)
+    entropy = np.random.SeedSequence(seed).entropy
+    cacheable = store is not None and seed is not None \
+        and isinstance(distribution, str) and isinstance(statistic, str)
+
+    def simulate(size):
+        if not replications:
+            return np.empty(0)
+        rng = np.random.default_rng([entropy, size])
+        return np.concatenate([
+            reduce(block) for block in sample_blocks(
+                rng, distribution, size, replications, chunk_size, dtype,
+                **params)])
+
+    results = {}
+    for size in sizes:
+        if cacheable:
+            # The chunk size doesn't change the results, so isn't part of
+            # the key
+            key = dict(params, distribution=distribution, n=size,
+                       replications=replications, statistic=statistic,
+                       dtype=None if dtype is None else np.dtype(dtype).str)
+            results[size] = store.cached('sampling_distribution', key, seed,
+                                         lambda seed, size=size:
+                                         simulate(size))
+        else:
+            results[size] = simulate(size)
+    return results[n] if np.isscalar(n) else results
+
+
+def _mean_and_sem(samples, axis):
+    n = samples.shape[axis]
+    return np.stack([samples.mean(axis=axis),
+                     samples.std(axis=axis, ddof=1) / np.sqrt(n)], axis=-1)
+
+
+def confidence_intervals(distribution, n, experiments, confidence=0.95,
+                         seed=None, dtype=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                         **params):
+    """Simulate `experiments` experiments of `n` observations each, and the
+    t confidence interval of each experiment's mean.
+
+    `distribution`, `params`, `seed`, `dtype` and `chunk_size` are as for
+    `sampling_distribution`. Returns a dict of arrays: 'mean' and 'sem' of
+    each experiment, and 'lower' and 'upper', the interval bounds, the
+    same as `t.interval(confidence, n - 1, loc=mean, scale=sem)`. For a
+    list of confidence levels the bounds have one row per level.
+
+    If `n` is a list of sizes, returns a dict of size -> dict.
+    """
+    from scipy.stats import t
+    sizes = [n] if np.isscalar(n) else list(n)
+    levels = np.asarray(confidence, dtype=float)
+    blocks = sampling_distribution(distribution, sizes, experiments,
+                                   _mean_and_sem, seed, dtype, chunk_size,
+                                   **params)
+    results = {}
+    for size in sizes:
+        block = blocks[size].reshape(experiments, 2)
+        mean, sem = block[:, 0], block[:, 1]
+        # One critical value per level, broadcast over all experiments
+        margin = np.multiply.outer(t.ppf((1 + levels) / 2, size - 1), sem)
+        results[size] = {'mean': mean, 'sem': sem,
+                         'lower': mean - margin, 'upper': mean + margin}
+    return results[n] if np.isscalar(n) else results
+
+
+def coverage(intervals, true_value):
+    """Return the share of `intervals` (from `confidence_intervals`) that
+    contain `true_value`, and the indices of the experiments that miss it.
+
+    For several confidence levels, returns an array of shares and a list
+    of index arrays, one per level.
+    """
+    missed = (intervals['lower'] > true_value) \
+        | (intervals['upper'] < true_value)
+    rate = 1 - missed.mean(axis=-1)
+    if missed.ndim == 1:
+        return rate, np.flatnonzero(missed)
+    return rate, [np.flatnonzero(row) for row in missed]
+
+
+def running_proportions(flips, runs=1, p=0.5, seed=None,
+                        points=DEFAULT_POINTS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Flip `runs` coins, each `flips` times, and follow the proportion
+    of heads (probability `p`) as the flips accumulate.
+
+    Returns (counts, proportions): the flip counts at which the proportion
+    was recorded, and an array of shape (runs, len(counts)). With at most
+    `points` flips that is after every flip; with more, after about
+    `points` flip counts spaced evenly on a log scale, which is what a
+    plot of the law of large numbers needs. Flips are drawn and summed
+    `chunk_size` at a time, so 10^8 or more of them need no more memory
+    than that. The same seed and chunk size give the same flips.
+    """
+    rng = np.random.default_rng(seed)
+    if flips <= points:
+        counts = np.arange(1, flips + 1)
+    else:
+        counts = np.unique(np.geomspace(1, flips, points).round()
+                           .astype(np.int64))
+    proportions = np.empty((runs, len(counts)))
+    heads = np.zeros((runs, 1), dtype=np.int64)
+    width = max(1, chunk_size // runs)
+    for start in range(0, flips, width):
+        stop = min(start + width, flips)
+        cumulative = heads + np.cumsum(rng.random((runs, stop - start)) < p,
+                                       axis=1)
+        # The recorded counts that fall in this chunk
+        first, last = np.searchsorted(counts, [start + 1, stop + 1])
+        recorded = counts[first:last]
+        proportions[:, first:last] = cumulative[:, recorded - start - 1] \
+            / recorded
+        heads = cumulative[:, -1:]
+    return counts, proportions
@@ -0,0 +1,91 @@
+"""Column types for the book's datasets.
+
+A dataset can have a schema in `Data/schemas/<name>.json` (without the
+`.csv`) mapping column names to the dtype the loader should give them, e.g.
+
+    {
+        "tutor": "category",
+        "grade": "int16",
+        "drug": {"dtype": "category",
+                 "categories": ["placebo", "anxifree", "joyzepam"]}
+    }
+
+A dtype is anything `DataFrame.astype` accepts, plus "string", which is
+pandas' string dtype backed by pyarrow when that is installed. Integer
+columns are checked to fit the declared width, and categoricals with
+declared categories to contain no other values, so a schema that no longer
+matches its data fails loudly instead of silently changing it.
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+
+import numpy as np
+
+from pythonbook.notebooks import SCHEMA_DIR
+
+
+def schema_path(name, schema_dir=SCHEMA_DIR):
+    return os.path.join(schema_dir, os.path.splitext(name)[0] + '.json')
+
+
+def load_schema(name, schema_dir=SCHEMA_DIR):
+    """Return the schema of dataset `name`, e.g. 'harpo.csv', or None."""
+    try:
+        with open(schema_path(name, schema_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def schema_hash(schema):
+    encoded = json.dumps(schema, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def resolve_dtype(spec):
+    import pandas as pd
+    if isinstance(spec, str):
+        spec = {'dtype': spec}
+    dtype = spec['dtype']
+    if dtype == 'string':
+        if importlib.util.find_spec('pyarrow') is not None:
+            return pd.StringDtype('pyarrow')
+        return pd.StringDtype()
+    if dtype == 'category' and 'categories' in spec:
+        return pd.CategoricalDtype(spec['categories'],
+                                   ordered=spec.get('ordered', False))
+    return pd.api.types.pandas_dtype(dtype)
+
+
+def apply_schema(df, schema):
+    """Return `df` with its columns converted as `schema` declares.
+
+    Columns the schema names but `df` lacks (e.g. after `usecols`) are
+    skipped. Raises ValueError if a column's values don't fit its dtype.
+    """
+    if not schema:
+        return df
+    import pandas as pd
+    converted = {}
+    for column, spec in schema.items():
+        if column not in df:
+            continue
+        values = df[column]
+        dtype = resolve_dtype(spec)
+        if isinstance(dtype, np.dtype) and dtype.kind in 'iu':
+            info = np.iinfo(dtype)
+            if values.isna().any() or values.min() < info.min \
+                    or values.max() > info.max:
+                raise ValueError('Column "%s" does not fit in %s'
+                                 % (column, dtype))
+        if isinstance(dtype, pd.CategoricalDtype) \
+                and dtype.categories is not None:
+            unknown = set(values.dropna()) - set(dtype.categories)
+            if unknown:
+                raise ValueError('Column "%s" has values outside its '
+                                 'categories: %s' % (column, sorted(unknown)))
+        converted[column] = values.astype(dtype)
+    return df.assign(**converted) if converted else df
@@ -0,0 +1,147 @@
+"""Share the book's datasets between kernels running at the same time.
+
+When several chapters run in parallel, each kernel would otherwise load its
+own copy of tables such as clintrial.csv or parenthood.csv.
+`SharedDatasetStore`, owned by run_notebooks.py, writes each table once as
+an Arrow IPC stream into a `multiprocessing.shared_memory` block and lists
+the blocks in a manifest file named by the PYTHONBOOK_SHARED_DATA
+environment variable, which the kernels inherit.
+
+In a kernel, `shared_frame` attaches to a block and returns a DataFrame whose
+numeric columns are views of the shared memory, not copies. Nothing stops a
+process from writing to a block it is attached to, so this relies on
+pandas' copy-on-write, which copies a column the first time a notebook
+modifies it. That is always on from pandas 3, and on pandas 2 only with
+PANDAS_COPY_ON_WRITE=1 in the environment; run_notebooks.py refuses
+--share-data without it, and `shared_frame` returns None, so the caller
+loads the dataset itself, without it or without pyarrow.
+"""
+
+import json
+import os
+import sys
+import tempfile
+from multiprocessing import resource_tracker, shared_memory
+
+from pythonbook.columnar import ColumnarCache
+from pythonbook.schemas import load_schema
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+SHARED_STORE_ENV = 'PYTHONBOOK_SHARED_DATA'
+
+# In a kernel: the manifest, and the attached blocks and their DataFrames,
+# which must stay open for as long as the process runs
+_manifest = None
+_attached = {}
+
+
+def available():
+    return pyarrow is not None
+
+
+def copy_on_write():
+    # Kernels inherit the environment, so on pandas 2 they copy on write
+    # exactly when this process does
+    import pandas as pd
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    try:
+        return pd.options.mode.copy_on_write is True
+    except AttributeError:
+        return False
+
+
+class SharedDatasetStore:
+    """Hold datasets in shared memory until `close()`.
+
+    Use as a context manager around running the notebooks.
+    """
+
+    def __init__(self):
+        self.blocks = {}
+        fd, self.manifest_path = tempfile.mkstemp(prefix='pythonbook-shared-',
+                                                  suffix='.json')
+        os.close(fd)
+        self._write_manifest()
+
+    def _write_manifest(self):
+        manifest = {path: {'name': block.name, 'size': block.size}
+                    for path, block in self.blocks.items()}
+        with open(self.manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+    def add(self, csv_path):
+        """Load the CSV at `csv_path` into shared memory."""
+        csv_path = os.path.abspath(csv_path)
+        if csv_path in self.blocks:
+            return
+        schema = load_schema(os.path.basename(csv_path))
+        table = pyarrow.Table.from_pandas(ColumnarCache().read(csv_path,
+                                                               schema))
+
+        def write(sink):
+            with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        # Measure first, then write straight into the block
+        mock = pyarrow.MockOutputStream()
+        write(mock)
+        block = shared_memory.SharedMemory(create=True, size=mock.size())
+        write(pyarrow.FixedSizeBufferWriter(pyarrow.py_buffer(block.buf)))
+        self.blocks[csv_path] = block
+        self._write_manifest()
+
+    def close(self):
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+        os.remove(self.manifest_path)
+
+    def __enter__(self):
+        os.environ[SHARED_STORE_ENV] = self.manifest_path
+        return self
+
+    def __exit__(self, *exc_info):
+        os.environ.pop(SHARED_STORE_ENV, None)
+        self.close()
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    block = shared_memory.SharedMemory(name=name)
+    # Otherwise the resource tracker unlinks the block when this kernel
+    # exits, while other kernels may still be using it
+    resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+def shared_frame(csv_path):
+    """Return the shared copy of the CSV at `csv_path`, or None."""
+    global _manifest
+    manifest_path = os.environ.get(SHARED_STORE_ENV)
+    if not manifest_path or pyarrow is None or not copy_on_write():
+        return None
+    if _manifest is None:
+        try:
+            with open(manifest_path) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    csv_path = os.path.abspath(csv_path)
+    entry = _manifest.get(csv_path)
+    if entry is None:
+        return None
+    if csv_path not in _attached:
+        block = _attach(entry['name'])
+        buffer = pyarrow.py_buffer(block.buf)[:entry['size']]
+        table = pyarrow.ipc.open_stream(buffer).read_all()
+        _attached[csv_path] = block, table.to_pandas(split_blocks=True)
+    # A shallow copy shares the columns, but pandas copies them on write
+    return _attached[csv_path][1].copy(deep=False)
@@ -0,0 +1,219 @@
+"""Synthetic versions of the Data/ tables at any number of rows.
+
+The bundled datasets are tiny, so the chapters' analysis code never runs on
+realistic amounts of data. `TableModel.fit` summarizes a table and
+`TableModel.chunks` draws new rows from that summary:
+
+- Text, boolean and low-cardinality integer columns (e.g. `tutor`, `drug`,
+  `year`) are categorical. Whole rows of them are drawn from their joint
+  frequencies in the original, so crosstabs keep their shape.
+- Numeric columns are drawn from a Gaussian copula: correlated normal draws
+  are mapped through each column's empirical quantiles. This keeps the
+  skew and tails of each column, the rank correlations between columns,
+  and their missing-value rates. A combination of categories with enough
+  rows uses its own quantiles; a smaller one (clintrial has three rows per
+  drug and therapy) uses its own mean plus the pooled deviations from the
+  group means. Either way, group differences survive.
+- Row identifiers such as `day` (1, 2, 3, ...) or `id` ("id_1", "id_2",
+  ...) continue their sequence.
+
+Rows are generated in chunks, each from its own seeded generator, so
+`generate('parenthood.csv', 10**8)` never holds more than one chunk in
+memory, and the same seed and chunk size always produce the same rows.
+"""
+
+import re
+
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+from pythonbook.notebooks import DATA_DIR, data_file_path
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+DISCRETE_MAX = 30 # most values an integer column can have as a category
+MIN_CELL_ROWS = 5 # rows a category combination needs for its own quantiles
+
+ID_RE = re.compile(r'^(.*?)(\d+)$')
+
+
+def _is_sequence(values):
+    values = np.sort(values)
+    return len(values) > 1 and bool(np.all(np.diff(values) == 1))
+
+
+def _string_id(values):
+    # Return the common prefix if every value is <prefix><number>, all
+    # numbers different
+    matches = [ID_RE.match(value) for value in values]
+    if not all(matches):
+        return None
+    prefixes = {match.group(1) for match in matches}
+    numbers = [int(match.group(2)) for match in matches]
+    if len(prefixes) != 1 or len(set(numbers)) != len(numbers):
+        return None
+    return prefixes.pop(), min(numbers)
+
+
+def _quantiles(values, u):
+    # Inverse empirical CDF, interpolating between the sorted values
+    positions = u * (len(values) - 1)
+    return np.interp(positions, np.arange(len(values)), values)
+
+
+def _normal_scores(values):
+    ranks = values.rank(method='average')
+    return ndtri((ranks - 0.5) / ranks.count())
+
+
+class TableModel:
+    """What `chunks()` needs to know about a table to imitate it."""
+
+    def __init__(self):
+        self.columns = []
+        self.dtypes = {}
+        self.ids = {} # column -> ('int', first) or ('str', (prefix, first))
+        self.categorical = []
+        self.numeric = []
+        self.integer = set()
+        self.cells = [] # tuples of category values
+        self.cell_probs = None
+        self.cell_values = [] # per cell: per numeric column sorted values
+        self.missing = None
+        self.factor = None # correlation of the normal scores, square root
+
+    @classmethod
+    def fit(cls, df):
+        import pandas as pd
+        model = cls()
+        model.columns = list(df.columns)
+        model.dtypes = dict(df.dtypes)
+        n = len(df)
+        for column in df.columns:
+            values = df[column]
+            kind = values.dtype.kind
+            unique = values.nunique()
+            string_id = _string_id(values.astype(str)) \
+                if kind not in 'biufc' and unique == n else None
+            if kind in 'iu' and unique == n and _is_sequence(values):
+                model.ids[column] = ('int', int(values.min()))
+            elif string_id:
+                model.ids[column] = ('str', string_id)
+            elif kind == 'f' or (kind in 'iu' and (unique > DISCRETE_MAX
+                                                  or unique > n / 2)):
+                model.numeric.append(column)
+                if kind in 'iu':
+                    model.integer.add(column)
+            else:
+                model.categorical.append(column)
+
+        if model.categorical:
+            groups = df.groupby(model.categorical, dropna=False, sort=True,
+                                observed=True)
+            keys, frames = zip(*groups)
+            model.cells = [key if isinstance(key, tuple) else (key,)
+                           for key in keys]
+        else:
+            frames = (df,)
+            model.cells = [()]
+        model.cell_probs = np.array([len(frame) for frame in frames]) / n
+
+        def sorted_values(frame):
+            return [np.sort(frame[column].dropna().to_numpy(dtype=float))
+                    for column in model.numeric]
+
+        # Cells too small for their own quantiles get their mean plus the
+        # pooled deviations from every cell's mean
+        numeric = df[model.numeric].astype(float)
+        cell_of_row = pd.Series(0, index=df.index)
+        for c, frame in enumerate(frames):
+            cell_of_row[frame.index] = c
+        cell_means = numeric.groupby(cell_of_row).transform('mean')
+        residuals = numeric - cell_means.fillna(numeric.mean())
+        residual_scores = residuals.apply(_normal_scores)
+        scores = []
+        for frame in frames:
+            if len(frame) >= MIN_CELL_ROWS:
+                model.cell_values.append(sorted_values(frame))
+                scores.append(frame[model.numeric].apply(_normal_scores))
+            else:
+                means = cell_means.loc[frame.index[0]].fillna(numeric.mean())
+                model.cell_values.append(
+                    [np.sort(residuals[column].dropna().to_numpy()
+                             + means[column]) for column in model.numeric])
+                scores.append(residual_scores.loc[frame.index])
+        model.missing = df[model.numeric].isna().mean().to_numpy()
+        if model.numeric:
+            corr = pd.concat(scores).corr().fillna(0).to_numpy(copy=True)
+            np.fill_diagonal(corr, 1.0)
+            # Pairwise correlations need not be positive semi-definite
+            eigenvalues, eigenvectors = np.linalg.eigh(corr)
+            model.factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0,
+                                                          None))
+        return model
+
+    def sample(self, rows, rng, start=0):
+        """Return `rows` new rows, numbered from `start`, as a DataFrame."""
+        import pandas as pd
+        cell = rng.choice(len(self.cells), size=rows, p=self.cell_probs)
+        data = {}
+        for j, column in enumerate(self.categorical):
+            levels = np.array([key[j] for key in self.cells], dtype=object)
+            data[column] = levels[cell]
+        if self.numeric:
+            z = rng.standard_normal((rows, len(self.numeric))) @ self.factor.T
+            u = ndtr(z)
+            numeric = np.empty_like(u)
+            for c, values in enumerate(self.cell_values):
+                in_cell = cell == c
+                for j in range(len(self.numeric)):
+                    if len(values[j]):
+                        numeric[in_cell, j] = _quantiles(values[j],
+                                                         u[in_cell, j])
+                    else:
+                        numeric[in_cell, j] = np.nan
+            for j, column in enumerate(self.numeric):
+                values = numeric[:, j]
+                if self.missing[j]:
+                    values[rng.random(rows) < self.missing[j]] = np.nan
+                if column in self.integer and not np.isnan(values).any():
+                    values = np.round(values).astype(self.dtypes[column])
+                data[column] = values
+        for column, (kind, first) in self.ids.items():
+            if kind == 'int':
+                data[column] = np.arange(first + start, first + start + rows,
+                                         dtype=self.dtypes[column])
+            else:
+                prefix, first = first
+                data[column] = ['%s%d' % (prefix, i) for i in
+                                range(first + start, first + start + rows)]
+        df = pd.DataFrame(data, columns=self.columns)
+        for column in self.categorical:
+            if self.dtypes[column].kind in 'biu':
+                df[column] = df[column].astype(self.dtypes[column])
+        return df
+
+    def chunks(self, rows, seed=0, chunk_size=DEFAULT_CHUNK_ROWS):
+        """Yield DataFrames of at most `chunk_size` rows, `rows` in total."""
+        for index, start in enumerate(range(0, rows, chunk_size)):
+            rng = np.random.default_rng([seed, index])
+            yield self.sample(min(chunk_size, rows - start), rng, start)
+
+
+def fit_dataset(name, data_dir=DATA_DIR):
+    import pandas as pd
+    return TableModel.fit(pd.read_csv(data_file_path(name, data_dir)))
+
+
+def generate(name, rows, seed=0, chunk_size=DEFAULT_CHUNK_ROWS,
+             data_dir=DATA_DIR):
+    """Yield chunks of a synthetic `rows`-row version of Data/`name`."""
+    return fit_dataset(name, data_dir).chunks(rows, seed, chunk_size)
+
+
+def write_csv(name, rows, path, seed=0, chunk_size=DEFAULT_CHUNK_ROWS,
+              data_dir=DATA_DIR):
+    """Write a synthetic version of Data/`name` to `path`, chunk by chunk."""
+    for index, chunk in enumerate(generate(name, rows, seed, chunk_size,
+                                           data_dir)):
+        chunk.to_csv(path, mode='w' if index == 0 else 'a',
+                     header=index == 0, index=False)
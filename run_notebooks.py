@@ -2,61 +2,617 @@
 # coding: utf-8
 
 import os
+import sys
 import argparse
+import asyncio
 import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
 
 import nbformat
+from nbclient import NotebookClient
 from nbconvert.preprocessors import ExecutePreprocessor
 from nbconvert.preprocessors.execute import CellExecutionError
 
-# Parse args
-parser = argparse.ArgumentParser(description="Runs a set of Jupyter \
-                                              notebooks.")
-file_text = """ Notebook file(s) to be run, e.g. '*.ipynb' (default),
-'my_nb1.ipynb', 'my_nb1.ipynb my_nb2.ipynb', 'my_dir/*.ipynb'
-"""
-parser.add_argument('file_list', metavar='F', type=str, nargs='*', 
-    help=file_text)
-parser.add_argument('-t', '--timeout', help='Length of time (in secs) a cell \
-    can run before raising TimeoutError (default 600).', default=600, 
-    required=False)
-parser.add_argument('-p', '--run-path', help='The path the notebook will be \
-    run from (default pwd).', default='.', required=False)
-args = parser.parse_args()
-print('Args:', args)
-if not args.file_list: # Default file_list
-    args.file_list = glob.glob('*.ipynb')
-
-# Check list of notebooks
-notebooks = []
-print('Notebooks to run:')
-for f in args.file_list:
+from pythonbook.cache import (ExecutionCache, DEFAULT_CACHE_DIR,
+                              DEFAULT_MAX_SIZE, notebook_key)
+from pythonbook.notebooks import (ROOT, code_cells, referenced_data_files,
+                                  data_file_path)
+from pythonbook.datasets import DATA_URL_ENV, OFFLINE_ENV, kernel_arguments
+from pythonbook.depgraph import (changed_cells, plan_partial, plan_resume,
+                                 mark_partial, unmark_partial)
+from pythonbook.journal import RunJournal, DEFAULT_JOURNAL_PATH
+from pythonbook.manifest import (DEFAULT_MANIFEST_PATH, check_manifest,
+                                 load_manifest, save_manifest,
+                                 update_manifest, preflight)
+from pythonbook.parameters import PROFILES, inject_parameters
+from pythonbook.prefetch import prefetch_notebooks
+from pythonbook import sharedstore
+from pythonbook.profiling import (ProfilingExecutePreprocessor,
+                                  save_notebook_profile, load_profiles,
+                                  write_report, format_summary)
+from pythonbook.incremental import (ExecutionState, DEFAULT_STATE_PATH,
+                                    environment_fingerprint, notebook_inputs)
+
+# Pool of warm kernels for this process, see init_kernel_pool()
+kernel_pool = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Runs a set of Jupyter \
+                                                  notebooks.")
+    file_text = """ Notebook file(s) to be run, e.g. '*.ipynb' (default),
+    'my_nb1.ipynb', 'my_nb1.ipynb my_nb2.ipynb', 'my_dir/*.ipynb'
+    """
+    parser.add_argument('file_list', metavar='F', type=str, nargs='*',
+        help=file_text)
+    parser.add_argument('-t', '--timeout', help='Length of time (in secs) a cell \
+        can run before raising TimeoutError (default 600).', default=600,
+        required=False)
+    parser.add_argument('-p', '--run-path', help='The path the notebook will be \
+        run from (default pwd).', default='.', required=False)
+    parser.add_argument('-j', '--jobs', help='Number of notebooks to run at \
+        the same time, each in its own worker process and kernel (default 1).',
+        default=1, type=int, required=False)
+    parser.add_argument('--no-cache', help='Always execute notebooks, \
+        ignoring and not updating the execution cache.', action='store_true')
+    parser.add_argument('--cache-dir', help='Directory for the execution \
+        cache (default %s).' % DEFAULT_CACHE_DIR, default=DEFAULT_CACHE_DIR,
+        required=False)
+    parser.add_argument('--cache-size', help='Maximum size of the execution \
+        cache in MB (default %d).' % (DEFAULT_MAX_SIZE // 2**20),
+        default=DEFAULT_MAX_SIZE // 2**20, type=int, required=False)
+    parser.add_argument('--incremental', help='Only run notebooks whose code, \
+        data files or Python environment changed since they last ran, and \
+        write the outputs of clean runs back into the notebooks themselves.',
+        action='store_true')
+    parser.add_argument('--state-file', help='Where --incremental records what \
+        each notebook last ran against (default %s).' % DEFAULT_STATE_PATH,
+        default=DEFAULT_STATE_PATH, required=False)
+    parser.add_argument('-w', '--warm-kernels', help='Number of spare kernels \
+        to keep started, with the common scientific packages already \
+        imported, in each worker (default 0, start a fresh kernel for each \
+        notebook).', default=0, type=int, required=False)
+    parser.add_argument('--profile', help='Record wall time, CPU time and \
+        peak memory for every executed cell and write profile.json and \
+        profile.csv to this directory. Notebooks restored from the cache are \
+        not profiled, so combine with --no-cache for a full report.',
+        metavar='DIR', default=None, required=False)
+    parser.add_argument('--profile-top', help='Number of slowest cells to list \
+        after a --profile run (default 10).', default=10, type=int,
+        required=False)
+    parser.add_argument('--partial', help='With --incremental, when only the \
+        code of a notebook changed, re-run just the edited cells, the cells \
+        that depend on them and the upstream cells needed to rebuild their \
+        state, keeping all other outputs.', action='store_true')
+    parser.add_argument('-a', '--async', help='Drive all kernels from this \
+        process with asyncio instead of one worker process per notebook, \
+        running up to --jobs notebooks at a time.', dest='use_async',
+        action='store_true')
+    parser.add_argument('--notebook-timeout', help='With --async, the time (in \
+        secs) a whole notebook may run before it is stopped (default no \
+        limit).', default=None, type=float, required=False)
+    parser.add_argument('--resume', help='Skip notebooks that completed in the \
+        previous run with the same inputs, and continue notebooks that \
+        stopped part way through from their first incomplete cell.',
+        action='store_true')
+    parser.add_argument('--journal', help='Where each run records its progress \
+        for --resume (default %s).' % DEFAULT_JOURNAL_PATH,
+        default=DEFAULT_JOURNAL_PATH, required=False)
+    parser.add_argument('--preview', help='Quick run with the simulation \
+        sizes in each notebook\'s "parameters" cell scaled down by SCALE \
+        (default %g). Outputs only go to _out.ipynb.' % PROFILES['preview'],
+        metavar='SCALE', nargs='?', const=PROFILES['preview'], default=None,
+        type=float, required=False)
+    parser.add_argument('--offline', help='Never download datasets: every \
+        dataset a notebook reads must be in Data/ or the dataset cache.',
+        action='store_true')
+    parser.add_argument('--data-url', help='Download datasets from DATA_URL, \
+        e.g. a local stand-in server, instead of the book\'s GitHub URL.',
+        default=None, required=False)
+    parser.add_argument('--share-data', help='Load each dataset that more \
+        than one of the notebooks reads into shared memory once, for all \
+        kernels to use, instead of once per kernel. Needs pyarrow.',
+        action='store_true')
+    parser.add_argument('--manifest', help='Data manifest with the size and \
+        checksum of every data file the notebooks read (default %s).'
+        % os.path.relpath(DEFAULT_MANIFEST_PATH), default=DEFAULT_MANIFEST_PATH,
+        required=False)
+    parser.add_argument('--update-manifest', help='Record the data files the \
+        notebooks read in the manifest, then exit without running them.',
+        action='store_true')
+    parser.add_argument('--no-preflight', help='Start running notebooks \
+        without first checking, and downloading, every data file they read.',
+        action='store_true')
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.use_async and (args.profile or args.warm_kernels):
+        parser.error('--async cannot be combined with --profile or '
+                     '--warm-kernels')
+    if args.preview is not None and args.preview <= 0:
+        parser.error('--preview scale must be greater than 0')
+    if args.preview and args.incremental:
+        # Preview outputs must never replace the published ones
+        parser.error('--preview cannot be combined with --incremental')
+    if args.share_data and not sharedstore.available():
+        parser.error('--share-data needs pyarrow')
+    if args.share_data and not sharedstore.copy_on_write():
+        parser.error('--share-data needs pandas copy-on-write: pandas 3, or '
+                     'pandas 2 with PANDAS_COPY_ON_WRITE=1')
+    return args
+
+
+def find_notebooks(file_list):
     # Find notebooks but not notebooks previously output from this script
-    if f.endswith('.ipynb') and not f.endswith('_out.ipynb'):
-        print(f[:-6])
-        notebooks.append(f[:-6]) # Want the filename without '.ipynb'
-
-# Execute notebooks and output
-num_notebooks = len(notebooks)
-print('*****')
-for i, n in enumerate(notebooks):
-    n_out = n + '_out'
+    notebooks = []
+    for f in file_list:
+        if f.endswith('.ipynb') and not f.endswith('_out.ipynb'):
+            notebooks.append(f[:-6]) # Want the filename without '.ipynb'
+    return notebooks
+
+
+def init_kernel_pool(size, run_path):
+    """Start this process's pool of warm kernels.
+
+    Used directly in serial mode and as the worker initializer in parallel
+    mode, so every worker keeps its own spares.
+    """
+    global kernel_pool
+    from pythonbook.kernelpool import KernelPool
+    kernel_pool = KernelPool(size, kernel_name='python3', cwd=run_path,
+                             extra_arguments=kernel_arguments())
+    # Worker processes exit without running atexit handlers, but do run
+    # multiprocessing finalizers
+    Finalize(kernel_pool, kernel_pool.shutdown, exitpriority=10)
+
+
+def run_notebook(n, args, cache=None, plan=None, base=None):
+    """Execute notebook `n` (no '.ipynb') and write it to `n`_out.ipynb.
+
+    Returns a (status, message, resume_from) triple, where status is one of
+    'ok', 'cached', 'error' or 'timeout' and resume_from is the first code
+    cell that did not complete, or None. If `cache` is given, a cache hit
+    restores the outputs without starting a kernel and a clean run is added
+    to the cache. With `args.incremental`, clean runs overwrite `n`.ipynb
+    itself and only failed runs go to `n`_out.ipynb. With `args.profile`,
+    per-cell timings are saved to `args.profile`/<name>.json. A `plan` from
+    plan_partial() or plan_resume() runs only some of the cells, keeping the
+    other outputs of `base` (default `n`). Safe to call from a worker
+    process: each call starts and shuts down its own kernel.
+    """
+    nb, key = read_notebook(base or n, cache, args.preview)
+    if cache and plan is None and cache.get(nb, key):
+        write_notebook(nb, n, args, 'cached')
+        return 'cached', 'Restored "%s" from the cache.' % n, None
+    status = 'ok'
+    on_cell_executed, completed = track_completed(nb)
+    ep_class = ProfilingExecutePreprocessor if args.profile \
+        else ExecutePreprocessor
+    ep = ep_class(timeout=int(args.timeout), kernel_name='python3',
+                  extra_arguments=kernel_arguments(),
+                  on_cell_executed=on_cell_executed)
+    km = kernel_pool.acquire() if kernel_pool else None
+    marks = mark_partial(nb, *plan) if plan else None
+    try:
+        ep.preprocess(nb, {'metadata': {'path': args.run_path}}, km=km)
+    except CellExecutionError:
+        status = 'error'
+    except TimeoutError:
+        status = 'timeout'
+    finally:
+        if km is not None:
+            kernel_pool.release(km)
+        if marks:
+            unmark_partial(nb, marks)
+        write_notebook(nb, n, args, status)
+        if args.profile:
+            save_notebook_profile(profile_path(n, args), n, ep.cell_profiles)
+    if cache and status == 'ok' and plan is None:
+        cache.put(nb, key)
+    return (status, status_message(n, status),
+            resume_point(nb, completed, plan))
+
+
+async def run_notebook_async(n, args, cache=None, plan=None, base=None):
+    """Coroutine version of run_notebook() for use with run_async().
+
+    The kernel is driven through nbclient's async API, so many notebooks can
+    run from one process. The whole notebook must finish within
+    `args.notebook_timeout` seconds, if set.
+    """
+    nb, key = read_notebook(base or n, cache, args.preview)
+    if cache and plan is None and cache.get(nb, key):
+        write_notebook(nb, n, args, 'cached')
+        return 'cached', 'Restored "%s" from the cache.' % n, None
+    status = 'ok'
+    on_cell_executed, completed = track_completed(nb)
+    client = NotebookClient(nb, timeout=int(args.timeout),
+                            kernel_name='python3',
+                            extra_arguments=kernel_arguments(),
+                            resources={'metadata': {'path': args.run_path}},
+                            on_cell_executed=on_cell_executed)
+    marks = mark_partial(nb, *plan) if plan else None
+    try:
+        await asyncio.wait_for(client.async_execute(), args.notebook_timeout)
+    except CellExecutionError:
+        status = 'error'
+    except TimeoutError:
+        status = 'timeout'
+    finally:
+        if marks:
+            unmark_partial(nb, marks)
+        write_notebook(nb, n, args, status)
+    if cache and status == 'ok' and plan is None:
+        cache.put(nb, key)
+    return (status, status_message(n, status),
+            resume_point(nb, completed, plan))
+
+
+def track_completed(nb):
+    """Return an on_cell_executed hook and the set of code cell positions
+    it fills in as cells complete without error."""
+    positions = {}
+    for cell in nb.cells:
+        if cell.cell_type == 'code':
+            positions[id(cell)] = len(positions)
+    completed = set()
+
+    def on_cell_executed(cell, cell_index, execute_reply):
+        if execute_reply and execute_reply['content']['status'] == 'ok':
+            completed.add(positions[id(cell)])
+
+    return on_cell_executed, completed
+
+
+def resume_point(nb, completed, plan=None):
+    # The first cell that should have run but didn't complete
+    to_run = plan[0] if plan else range(len(code_cells(nb)))
+    remaining = [i for i in to_run if i not in completed
+                 and code_cells(nb)[i].source.strip()]
+    return min(remaining) if remaining else None
+
+
+def read_notebook(n, cache=None, scale=None):
+    # With a preview `scale` the injected parameters are part of the code,
+    # so previews get their own cache and journal keys
     with open(n + '.ipynb') as f:
         nb = nbformat.read(f, as_version=4)
-        ep = ExecutePreprocessor(timeout=int(args.timeout), kernel_name='python3')
+    if scale:
+        inject_parameters(nb, scale)
+    key = notebook_key(nb) if cache else None
+    return nb, key
+
+
+def write_notebook(nb, n, args, status):
+    # Write output file. In incremental mode good outputs replace the
+    # notebook's own, but a failed run must never overwrite them.
+    if args.incremental and status in ('ok', 'cached'):
+        n_out = n
+    else:
+        n_out = n + '_out'
+    with open(n_out + '.ipynb', mode='wt') as f:
+        nbformat.write(nb, f)
+
+
+def status_message(n, status):
+    if status == 'error':
+        msg = 'Error executing the notebook "%s".\n' % n
+        msg += 'See notebook "%s" for the traceback.' % (n + '_out')
+        return msg
+    if status == 'timeout':
+        return 'Timeout executing the notebook "%s".\n' % n
+    return None
+
+
+def run_serial(notebooks, args, cache, options, on_finish):
+    statuses = {}
+    num_notebooks = len(notebooks)
+    for i, n in enumerate(notebooks):
+        print('Running', n, ':', i, '/', num_notebooks)
         try:
-            print('Running', n, ':', i, '/', num_notebooks)
-            out = ep.preprocess(nb, {'metadata': {'path': args.run_path}})
-        except CellExecutionError:
-            out = None
-            msg = 'Error executing the notebook "%s".\n' % n
-            msg += 'See notebook "%s" for the traceback.' % n_out
+            statuses[n], msg, resume_from = run_notebook(n, args, cache,
+                                                         **options.get(n, {}))
+        except Exception as e:
+            # e.g. the kernel died or failed to start; record it like any
+            # other failure so the journal still covers this notebook
+            statuses[n], resume_from = 'error', None
+            msg = 'Failed to run the notebook "%s": %r' % (n, e)
+        if msg:
             print(msg)
-        except TimeoutError:
-            msg = 'Timeout executing the notebook "%s".\n' % n
+        on_finish(n, statuses[n], resume_from)
+    return statuses
+
+
+def run_parallel(notebooks, args, cache, options, on_finish):
+    statuses = {}
+    num_notebooks = len(notebooks)
+    initializer, initargs = None, ()
+    if args.warm_kernels:
+        initializer = init_kernel_pool
+        initargs = (args.warm_kernels, args.run_path)
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=initializer,
+                             initargs=initargs) as pool:
+        futures = {}
+        for n in notebooks:
+            futures[pool.submit(run_notebook, n, args, cache,
+                                **options.get(n, {}))] = n
+        for i, future in enumerate(as_completed(futures), 1):
+            n = futures[future]
+            try:
+                statuses[n], msg, resume_from = future.result()
+            except Exception as e:
+                # The worker died before it could write n_out, e.g. the
+                # notebook could not be read or the kernel failed to start.
+                statuses[n], resume_from = 'error', None
+                msg = 'Failed to run the notebook "%s": %r' % (n, e)
+            print('Finished', n, ':', i, '/', num_notebooks)
+            if msg:
+                print(msg)
+            on_finish(n, statuses[n], resume_from)
+    return statuses
+
+
+async def run_async(notebooks, args, cache, options, on_finish):
+    """Run up to `args.jobs` notebooks at a time on one event loop."""
+    statuses = {}
+    num_notebooks = len(notebooks)
+    limit = asyncio.Semaphore(args.jobs)
+
+    async def run_one(n):
+        async with limit:
+            print('Running', n)
+            try:
+                return n, await run_notebook_async(n, args, cache,
+                                                   **options.get(n, {}))
+            except Exception as e:
+                return n, ('error', 'Failed to run the notebook "%s": %r'
+                           % (n, e), None)
+
+    tasks = [run_one(n) for n in notebooks]
+    for i, task in enumerate(asyncio.as_completed(tasks), 1):
+        n, (statuses[n], msg, resume_from) = await task
+        print('Finished', n, ':', i, '/', num_notebooks)
+        if msg:
             print(msg)
-        finally:
-            # Write output file
-            with open(n_out + '.ipynb', mode='wt') as f:
-                nbformat.write(nb, f)
-                
\ No newline at end of file
+        on_finish(n, statuses[n], resume_from)
+    return statuses
+
+
+def select_changed(notebooks, state, partial=False):
+    """Find the `notebooks` that need running.
+
+    Returns the changed notebooks, the inputs of every notebook, and, if
+    `partial`, run_notebook() options with a plan_partial() plan for each
+    notebook where only some code cells need re-running.
+    """
+    environment = environment_fingerprint()
+    changed, inputs, options = [], {}, {}
+    for n in notebooks:
+        with open(n + '.ipynb') as f:
+            nb = nbformat.read(f, as_version=4)
+        inputs[n] = notebook_inputs(nb, environment)
+        changes = state.changes(state_key(n), inputs[n])
+        if not changes:
+            print('Up to date', n)
+            continue
+        changed.append(n)
+        print('Changed', n, ':', ', '.join(changes))
+        previous = state.previous(state_key(n))
+        if partial and changes == ['code'] and 'cells' in previous:
+            sources = [cell.source for cell in code_cells(nb)]
+            edited = changed_cells(previous['cells'], inputs[n]['cells'])
+            # Nothing edited (e.g. only trailing cells removed) or nothing
+            # to re-run means the plan can't be trusted: run it all
+            rerun, seed = plan_partial(sources, edited) if edited \
+                else ((), ())
+            if rerun and len(rerun) + len(seed) < len(sources):
+                options[n] = {'plan': (rerun, seed)}
+                print('  re-running %d and seeding from %d of %d code cells'
+                      % (len(rerun), len(seed), len(sources)))
+    return changed, inputs, options
+
+
+def select_unfinished(notebooks, journal, options, args):
+    """Drop the `notebooks` the journal says already completed.
+
+    Notebooks that stopped part way through resume from their first
+    incomplete cell, starting from the outputs in their _out.ipynb. Returns
+    the remaining notebooks and the journal key of every notebook.
+    """
+    remaining, keys = [], {}
+    for n in notebooks:
+        nb, _ = read_notebook(n, scale=args.preview)
+        keys[n] = notebook_key(nb)
+        if journal.completed(state_key(n), keys[n]):
+            print('Already completed', n)
+            continue
+        remaining.append(n)
+        first = journal.resume_point(state_key(n), keys[n])
+        if first is None or not os.path.exists(n + '_out.ipynb'):
+            continue
+        out, _ = read_notebook(n + '_out', scale=args.preview)
+        if notebook_key(out) != keys[n]:
+            continue
+        sources = [cell.source for cell in code_cells(nb)]
+        options[n] = {'plan': plan_resume(sources, first),
+                      'base': n + '_out'}
+        print('Resuming', n, 'from code cell', first)
+    return remaining, keys
+
+
+def check_data(notebooks, args):
+    # Exit before any kernel starts if a notebook would fail to read its data
+    manifest = load_manifest(args.manifest)
+    nbs = {n: read_notebook(n)[0] for n in notebooks}
+    if not args.offline:
+        # Download whatever is missing concurrently now, rather than one
+        # read_csv at a time inside the kernels. Failures are tried again,
+        # and reported, by preflight()
+        downloaded, _ = prefetch_notebooks(nbs)
+        for name in downloaded:
+            print('Downloaded', name)
+    unrecorded = [name for name, entry in manifest['remote'].items()
+                  if not entry]
+    problems = preflight(nbs, manifest, args.run_path)
+    recorded = [name for name in unrecorded if manifest['remote'][name]]
+    if recorded:
+        save_manifest(manifest, args.manifest)
+        for name in recorded:
+            print('Recorded the checksum of', name, 'in', args.manifest)
+    manifest_problems = check_manifest(manifest)
+    if not problems and not manifest_problems:
+        return
+    print('*****')
+    for reference, readers, problem in problems:
+        print('Missing input for %s:' % ', '.join(readers))
+        print('  %s' % problem)
+    for problem in manifest_problems:
+        print('Data manifest:', problem)
+    sys.exit(1)
+
+
+def write_manifest(notebooks, args):
+    manifest = load_manifest(args.manifest)
+    update_manifest(manifest, {state_key(n): read_notebook(n)[0]
+                               for n in notebooks}, offline=args.offline)
+    save_manifest(manifest, args.manifest)
+    print('Wrote %d datasets to %s' % (len(manifest['datasets']),
+                                       args.manifest))
+    for name, entry in sorted(manifest['remote'].items()):
+        print('Not in Data/, only on the data server:', name)
+        if not entry:
+            print('  could not download it; its checksum will be recorded '
+                  'when it is first downloaded')
+
+
+def shared_datasets(notebooks):
+    # The Data/ files read by more than one of the notebooks
+    readers = {}
+    for n in notebooks:
+        nb, _ = read_notebook(n)
+        for name in referenced_data_files(nb):
+            readers[name] = readers.get(name, 0) + 1
+    return [data_file_path(name) for name, count in sorted(readers.items())
+            if count > 1 and os.path.exists(data_file_path(name))]
+
+
+def run_notebooks(notebooks, args, cache, options, on_finish):
+    if args.use_async:
+        return asyncio.run(run_async(notebooks, args, cache, options,
+                                     on_finish))
+    if args.jobs > 1 and len(notebooks) > 1:
+        return run_parallel(notebooks, args, cache, options, on_finish)
+    if args.warm_kernels and notebooks:
+        init_kernel_pool(args.warm_kernels, args.run_path)
+    return run_serial(notebooks, args, cache, options, on_finish)
+
+
+def profile_path(n, args):
+    return os.path.join(args.profile, os.path.basename(n) + '.json')
+
+
+def report_profile(notebooks, args):
+    rows = load_profiles([profile_path(n, args) for n in notebooks])
+    write_report(rows, args.profile)
+    print('*****')
+    print('Profile of %d cells written to %s' % (len(rows), args.profile))
+    print('Slowest cells:')
+    print(format_summary(rows, args.profile_top))
+
+
+def state_key(n):
+    return os.path.relpath(os.path.abspath(n + '.ipynb'), ROOT)
+
+
+def main():
+    args = parse_args()
+    print('Args:', args)
+    if not args.file_list: # Default file_list
+        args.file_list = glob.glob('*.ipynb')
+
+    # Check list of notebooks
+    notebooks = find_notebooks(args.file_list)
+    print('Notebooks to run:')
+    for n in notebooks:
+        print(n)
+
+    if args.update_manifest:
+        write_manifest(notebooks, args)
+        return
+
+    # Kernels inherit the environment, so this reaches pythonbook.datasets
+    # in every notebook
+    if args.offline:
+        os.environ[OFFLINE_ENV] = '1'
+    if args.data_url:
+        os.environ[DATA_URL_ENV] = args.data_url
+
+    cache = None
+    if not args.no_cache:
+        cache = ExecutionCache(args.cache_dir, args.cache_size * 2**20)
+
+    state, options = None, {}
+    if args.incremental:
+        state = ExecutionState(args.state_file)
+        print('*****')
+        notebooks, inputs, options = select_changed(notebooks, state,
+                                                    args.partial)
+
+    # The journal records each notebook as it finishes, so that a run that
+    # is interrupted can be picked up again with --resume
+    journal = RunJournal(args.journal)
+    if args.resume:
+        print('*****')
+        notebooks, keys = select_unfinished(notebooks, journal, options,
+                                          args)
+    else:
+        journal.reset()
+        keys = {n: notebook_key(read_notebook(n, scale=args.preview)[0])
+                for n in notebooks}
+
+    def on_finish(n, status, resume_from):
+        journal.record(state_key(n), keys[n], status in ('ok', 'cached'),
+                       resume_from)
+
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    if not args.no_preflight:
+        check_data(notebooks, args)
+
+    # Execute notebooks and output
+    print('*****')
+    datasets = shared_datasets(notebooks) if args.share_data else []
+    if datasets:
+        with sharedstore.SharedDatasetStore() as store:
+            for path in datasets:
+                print('Sharing', os.path.basename(path))
+                store.add(path)
+            statuses = run_notebooks(notebooks, args, cache, options,
+                                     on_finish)
+    else:
+        statuses = run_notebooks(notebooks, args, cache, options, on_finish)
+
+    if state is not None:
+        for n, status in statuses.items():
+            if status in ('ok', 'cached'):
+                state.record(state_key(n), inputs[n])
+            else:
+                state.forget(state_key(n))
+        state.save()
+
+    if args.profile:
+        report_profile(notebooks, args)
+
+    # A failed chapter must stop build.sh before it publishes anything
+    failed = [n for n, status in statuses.items()
+              if status not in ('ok', 'cached')]
+    if failed:
+        print('*****')
+        print('Failed:', ', '.join(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()